@@ -11,13 +11,39 @@
 # GNU General Public License for details <http://www.gnu.org/licenses/>.
 
 import re
+import sys
 
 """ Coordinate Converter
 Decimal Degrees (DD)			signed float
 Degrees, Decimal Minutes (DDM)		(signed int, float)
 Degrees, Minutes, Seconds (DMS)		(signed int, int, float)
+
+Parser for the coordinate strings
+angle   DD, DDM or DMS, symbols ° ′ ″ ' " or blanks, sign or N/S/E/W
+pair    latitude and longitude separated by "/", ",", ";" or TAB
 """
 
+# one angle, the hemisphere letter may be before or after the numbers
+ANGLE = re.compile(r"""^\s*
+    (?P<sign>[-+])?\s*
+    (?P<pre>[NSEWnsew](?=[\s\d]))?\s*
+    (?P<deg>\d+(?:\.\d*)?)\s*[°º]?\s*
+    (?:(?P<min>\d+(?:\.\d*)?)\s*(?:[′']|(?=[\s\d]))?\s*
+       (?:(?P<sec>\d+(?:\.\d*)?)\s*(?:[″"]|\'\'|′′)?\s*)?
+    )?
+    (?P<hemi>[NSEWnsew])?\s*$""", re.VERBOSE)
+
+# plain decimal degrees, the fast path
+DECIMAL = re.compile(r'^\s*[-+]?\d+(?:\.\d*)?\s*$')
+
+PAIR = re.compile(r'\s*[/,;\t]\s*')
+
+HEMISPHERES = {'lat': {'N': +1, 'S': -1}, 'lon': {'E': +1, 'W': -1}}
+LIMITS = {'lat': 90.0, 'lon': 180.0}
+NAMES = {'lat': 'latitude', 'lon': 'longitude'}
+
+STEP = 0.01   # grid cell of the sunrise dictionary in degrees, about 1 km
+
 def dd(tup):
     """ Decimal Degrees (DD) from DDM or DMS
     """
@@ -104,17 +130,175 @@ def unit_tests():
     print(f'ddm to dms {dms((i0, f1))}')
     print(f'dms to dms {dms((i1, i2, f2))}')
 
+def parse_angle(text, axis='lat'):
+    """ Decimal Degrees (DD) from a DD, DDM or DMS string, axis is 'lat' or 'lon'.
+    Raise ValueError with the reason.
+    """
+    name = NAMES[axis]
+    if DECIMAL.match(text):
+        f = float(text)
+    else:
+        m = ANGLE.match(text)
+        if not m:
+            raise ValueError(f'{name}: cannot parse "{text.strip()}"')
+        deg, mins, secs = m.group('deg'), m.group('min'), m.group('sec')
+        if mins is not None and '.' in deg:
+            raise ValueError(f'{name}: fractional degrees with minutes "{text.strip()}"')
+        if secs is not None and '.' in mins:
+            raise ValueError(f'{name}: fractional minutes with seconds "{text.strip()}"')
+        if mins is not None and float(mins) >= 60.0:
+            raise ValueError(f'{name}: minutes {mins} out of range')
+        if secs is not None and float(secs) >= 60.0:
+            raise ValueError(f'{name}: seconds {secs} out of range')
+
+        letters = [h.upper() for h in (m.group('pre'), m.group('hemi')) if h]
+        if len(letters) > 1:
+            raise ValueError(f'{name}: two hemisphere letters "{text.strip()}"')
+        s = -1 if m.group('sign') == '-' else +1
+        if letters:
+            if letters[0] not in HEMISPHERES[axis]:
+                raise ValueError(f'{name}: hemisphere {letters[0]} is not valid')
+            if m.group('sign'):
+                raise ValueError(f'{name}: both sign and hemisphere "{text.strip()}"')
+            s = HEMISPHERES[axis][letters[0]]
+
+        f = float(deg)
+        if secs is not None:
+            f += (float(mins) + float(secs) / 60.0) / 60.0
+        elif mins is not None:
+            f += float(mins) / 60.0
+        f = s * f
+
+    if abs(f) > LIMITS[axis]:
+        raise ValueError(f'{name} {f:g} out of range')
+    return f
+
+def parse_coords(coords):
+    """ Decimal Degrees (lat, lon) from a coordinate pair string.
+    Raise ValueError with the reason.
+    """
+    items = PAIR.split(coords.strip())
+    if len(items) != 2:
+        raise ValueError(f'expected latitude and longitude separated by "/" or ",", got {len(items)} items')
+    return (parse_angle(items[0], 'lat'), parse_angle(items[1], 'lon'))
+
+def decimal(text, axis='lat'):
+    """ Decimal Degrees string from a DD, DDM or DMS string.
+    Plain decimal input is returned as it is, to keep the dictionary keys.
+    """
+    if DECIMAL.match(text):
+        parse_angle(text, axis)
+        return text.strip()
+    return f'{parse_angle(text, axis):.6f}'
+
+def site_coords(fields):
+    """ Decimal Degrees strings (lat, lon) from the coordinate fields of a configuration
+    line: latitude and longitude, or one field with the pair. Raise ValueError with the reason.
+    """
+    if len(fields) >= 2:
+        return (decimal(fields[0], 'lat'), decimal(fields[1], 'lon'))
+    items = PAIR.split(fields[0].strip())
+    if len(items) != 2:
+        raise ValueError(f'expected latitude and longitude separated by "/" or ",", got {len(items)} items')
+    return (decimal(items[0], 'lat'), decimal(items[1], 'lon'))
+
+def parse_lines(lines):
+    """ Bulk mode: yield (line number, lat, lon, error) for each coordinate pair line.
+    Empty and comment lines are skipped, error is None or the reason.
+    """
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        try:
+            lat, lon = parse_coords(line)
+        except ValueError as e:
+            yield (n, None, None, str(e))
+            continue
+        yield (n, lat, lon, None)
+
+def parse_file(fname, out=sys.stdout, err=sys.stderr):
+    """ Convert a file of coordinate strings ("-" is stdin) to TAB separated DD values.
+    Bad lines are reported to err as "fname:line: reason". Return (good, bad) counts.
+    """
+    good, bad = 0, 0
+    f = sys.stdin if fname == '-' else open(fname, 'r')
+    try:
+        write = out.write
+        for n, lat, lon, error in parse_lines(f):
+            if error:
+                bad += 1
+                print(f'{fname}:{n}: {error}', file=err)
+            else:
+                good += 1
+                write(f'{lat:.6f}\t{lon:.6f}\n')
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return (good, bad)
+
+def cell(lat, lon):
+    """ Grid cell (int, int) of (lat, lon) in decimal degrees.
+    """
+    return (round(lat / STEP), round(lon / STEP))
+
+def cell_key(lat, lon):
+    """ Dictionary key "lat;lon" of the grid cell centre.
+    """
+    return key_of_cell(cell(lat, lon))
+
+def key_of_cell(c):
+    return f'{c[0] * STEP:.2f};{c[1] * STEP:.2f}'
+
+def grid_index(D):
+    """ Hashed grid index of a dictionary with "lat;lon" keys: cell -> entry.
+    Entries falling into the same cell are merged, the newest timestamp wins.
+    """
+    index = {}
+    for key, entry in D.items():
+        try:
+            lat, lon = (float(x) for x in key.split(';'))
+        except ValueError:
+            continue
+        c = cell(lat, lon)
+        if c not in index or index[c].get('timestamp', '') < entry.get('timestamp', ''):
+            index[c] = entry
+    return index
+
+def grid_lookup(index, lat, lon):
+    """ Entry of the grid cell of (lat, lon), or the nearest entry
+    of the neighbour cells within one cell distance, or None.
+    """
+    i, j = lat / STEP, lon / STEP
+    c = (round(i), round(j))
+    if c in index:
+        return index[c]
+    best, dist = None, 1.0
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            n = (c[0] + di, c[1] + dj)
+            if n in index:
+                d = (n[0] - i) ** 2 + (n[1] - j) ** 2
+                if d <= dist:
+                    best, dist = index[n], d
+    return best
+
 def on_city(city, coords):
-    [lat, lon] = re.split("[, /]+", coords)
-    lat = re.split(u"[°′']", lat)
-    lon = re.split(u"[°′']", lon)
-    lat = dd((int(lat[0]) if lat[2]=='N' else -int(lat[0]), float(lat[1])))
-    lon = dd((int(lon[0]) if lon[2]=='E' else -int(lon[0]), float(lon[1])))
+    lat, lon = parse_coords(coords)
     print(f'{city} {coords} -> {lat:.6f} {lon:.6f}')
     return
 
 if __name__ == '__main__':
-    on_city("Les Sables d'Olonne, France", u"46°29.81′N, 1°47.74′W")
-    on_city("Manila, Philippines", u"14°35'N / 120°59'E")
-    on_city("Jakarta, Indonesia", u"6°09'S / 106°49'E")
+    if len(sys.argv) == 3 and sys.argv[1] == '-f':
+        good, bad = parse_file(sys.argv[2])
+        print(f'{good} converted, {bad} failed', file=sys.stderr)
+    elif len(sys.argv) > 1:
+        print(f"""
+Usage: python3 coord.py [-f coordinates_file]
+    convert one "lat / lon" pair per line to decimal degrees, "-" is stdin
+""", file=sys.stderr)
+    else:
+        on_city("Les Sables d'Olonne, France", u"46°29.81′N, 1°47.74′W")
+        on_city("Manila, Philippines", u"14°35'N / 120°59'E")
+        on_city("Jakarta, Indonesia", u"6°09'S / 106°49'E")
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import datetime
+import pytz
+import tzbundle
+import tzrows
+
+""" DST radar
+List the UTC offset changes of the configured sites for the next weeks,
+and how the relative offsets between the sites shift at each change.
+The changes come from the sorted transition tables of the bundle.
+"""
+
+
+def radar_events(sites, since, until):
+    """ Offset changes of all sites, grouped by time.
+    Return sorted list of (ts, {site index: (old, new)}), offsets in seconds.
+    """
+    events = {}
+    zone_changes = {}
+    for k, (zone, city, country) in enumerate(sites):
+        if zone not in zone_changes:
+            zone_changes[zone] = tzbundle.offset_changes(zone, since, until)
+        for ts, old, new in zone_changes[zone]:
+            events.setdefault(ts, {})[k] = (old, new)
+    return sorted(events.items())
+
+
+def report(sites, base, weeks, all_pairs=False, out=sys.stdout):
+    """ Print the offset changes of the next weeks, relative to the base site,
+    or between all pairs of sites.
+    """
+    since = int(time.time())
+    until = since + weeks * 7 * 86400
+    tzbundle.use_bundle([site[0] for site in sites])
+    names = [site[1].strip() for site in sites]
+
+    events = radar_events(sites, since, until)
+    if not events:
+        print(f'no UTC offset changes in the next {weeks} weeks', file=out)
+        return
+
+    for ts, changed in events:
+        when = (tzbundle.EPOCH + datetime.timedelta(seconds=ts)).strftime('%Y-%m-%d %H:%M UTC')
+        before = [tzbundle.offset_at(zone, ts - 1) // 60 for zone, city, country in sites]
+        after = [tzbundle.offset_at(zone, ts) // 60 for zone, city, country in sites]
+        for k in sorted(changed):
+            print(f'{when}  {names[k]} ({sites[k][0]}) {tzrows.rel_offset(0, before[k])} > {tzrows.rel_offset(0, after[k])} from UTC', file=out)
+
+        if all_pairs:
+            pairs = [(a, b) for a in range(len(sites)) for b in range(a+1, len(sites))
+                     if (a in changed or b in changed)
+                     and before[b] - before[a] != after[b] - after[a]]
+        else:
+            pairs = [(base, b) for b in range(len(sites))
+                     if b != base and (base in changed or b in changed)
+                     and before[b] - before[base] != after[b] - after[base]]
+        for a, b in pairs:
+            print(f'    {names[b]} relative to {names[a]}: '
+                  f'{tzrows.rel_offset(before[a], before[b])} > {tzrows.rel_offset(after[a], after[b])}', file=out)
+    return
+
+
+if __name__ == '__main__':
+    tzlist_file = tzrows.TZLIST
+    weeks = 8
+    base = None
+    all_pairs = False
+
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 dstradar.py [-t tzlist_file] [-w weeks] [-b zone_or_city] [-a]
+    list the UTC offset changes of the configured sites
+    options:
+        -w  weeks ahead, default {weeks}
+        -b  base site of the relative offsets, default the local zone or the first site
+        -a  all pairs of sites, not only relative to the base
+""", file=sys.stderr)
+            quit()
+        elif option == "-t" and i+1 < len(sys.argv):
+            i += 1
+            if os.path.isfile(sys.argv[i]):
+                tzlist_file = sys.argv[i]
+        elif option == "-w" and i+1 < len(sys.argv):
+            i += 1
+            weeks = int(sys.argv[i])
+        elif option == "-b" and i+1 < len(sys.argv):
+            i += 1
+            base = sys.argv[i]
+        elif option == "-a":
+            all_pairs = True
+        i += 1
+
+    sites = [site for site in tzbundle.read_tzlist(tzlist_file) if site[0] in pytz.all_timezones_set]
+    if not sites:
+        print(f'no sites from {tzlist_file}', file=sys.stderr)
+        quit()
+    if base is None:
+        import tzlocal
+        base = str(tzlocal.get_localzone())
+    index = [k for k, (zone, city, country) in enumerate(sites) if base in (zone, city.strip())]
+
+    report(sites, index[0] if index else 0, weeks, all_pairs)
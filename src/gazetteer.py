@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import re
+import mmap
+import struct
+import difflib
+import unicodedata
+from array import array
+import pytz
+import coord
+
+""" Offline city gazetteer
+The source is util/cities.tsv (name, country, zone, lat, lon, population)
+or a GeoNames cities*.txt dump, compiled into one binary file and
+memory-mapped. The records are sorted by the normalized name, the first
+byte of the name is the prefix index into the sorted arrays. The trigrams
+of the names bound the candidates of the fuzzy matching, for typos.
+
+File layout (native byte order):
+  header   magic '4s', records 'I', zones 'H', countries 'H', section sizes 'I'*3,
+           trigrams 'I', postings 'I'
+  sections zones and countries ('\\0' separated), names blob,
+           key starts 'I'*(n+1), name starts 'I'*(n+1), prefix 'I'*257,
+           lat 'f'*n, lon 'f'*n, population 'I'*n, zone 'H'*n, country 'H'*n,
+           sorted trigrams '3s'*t, posting starts 'I'*(t+1), postings 'I'*p
+"""
+
+MAGIC = b'GZT2'
+GAZETTEER = os.environ.get('HOME') + '/.config/TimeZ/gazetteer.bin'
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'util', 'cities.tsv')
+HEADER = '<4sIHHIIIII'
+# the country names of the GeoNames codes, like the sample configuration has them
+COUNTRIES = dict(pytz.country_names, **{'US': 'US', 'GB': 'UK', 'AE': 'UAE', 'KR': 'South Korea',
+                                        'CZ': 'Czechia', 'WS': 'Samoa'})
+FUZZY = 200   # candidates of the fuzzy matching, by the most common trigrams
+
+
+def normalize(name):
+    """ Lower case ASCII key of a city name, accents removed.
+    """
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return re.sub(r'\s+', ' ', name.lower()).strip()
+
+
+def trigrams(key):
+    # trigrams of a normalized key, the word boundaries are padded
+    key = f' {key} '.encode()
+    return set(key[i:i+3] for i in range(len(key) - 2))
+
+
+def read_source(fname):
+    """ Records (name, country, zone, lat, lon, population) of the source file.
+    """
+    records = []
+    with open(fname, 'r', encoding='utf-8') as f:
+        for raw in f:
+            if raw[0] == '#' or not raw.strip():
+                continue
+            items = raw.rstrip('\n').split('\t')
+            try:
+                if len(items) >= 18:
+                    # GeoNames: name, ascii name, ..., lat, lon, ..., country code, ..., population, ..., timezone
+                    country = COUNTRIES.get(items[8].upper(), items[8])
+                    records.append((items[1], country, items[17], float(items[4]), float(items[5]), int(items[14] or 0)))
+                elif len(items) >= 5:
+                    pop = int(items[5]) if len(items) > 5 and items[5] else 0
+                    records.append((items[0], items[1], items[2], float(items[3]), float(items[4]), pop))
+            except ValueError:
+                continue
+    return records
+
+
+def build(records, fname=GAZETTEER):
+    """ Compile the records into the gazetteer file. Return the number of records.
+    """
+    records = sorted(records, key=lambda rec: (normalize(rec[0]), -rec[5]))
+    zones = sorted(set(rec[2] for rec in records))
+    countries = sorted(set(rec[1] for rec in records))
+    zone_ix = {z: i for i, z in enumerate(zones)}
+    country_ix = {c: i for i, c in enumerate(countries)}
+
+    blob = bytearray()
+    key_starts, name_starts = array('I'), array('I')
+    for rec in records:
+        key_starts.append(len(blob))
+        blob += normalize(rec[0]).encode()
+    key_starts.append(len(blob))
+    for rec in records:
+        name_starts.append(len(blob))
+        blob += rec[0].encode()
+    name_starts.append(len(blob))
+
+    # prefix[b] is the first record with key >= bytes([b])
+    prefix = array('I', [0] * 257)
+    k = 0
+    for b in range(256):
+        while k < len(records) and blob[key_starts[k]:key_starts[k]+1] < bytes([b]):
+            k += 1
+        prefix[b] = k
+    prefix[256] = len(records)
+
+    postings = {}
+    for k in range(len(records)):
+        for tri in trigrams(normalize(records[k][0])):
+            postings.setdefault(tri, array('I')).append(k)
+    tris = sorted(postings)
+    tri_starts = array('I', [0])
+    for tri in tris:
+        tri_starts.append(tri_starts[-1] + len(postings[tri]))
+
+    zones_b = '\0'.join(zones).encode()
+    countries_b = '\0'.join(countries).encode()
+    body = b''.join((zones_b, countries_b, bytes(blob),
+                     key_starts.tobytes(), name_starts.tobytes(), prefix.tobytes(),
+                     array('f', (rec[3] for rec in records)).tobytes(),
+                     array('f', (rec[4] for rec in records)).tobytes(),
+                     array('I', (min(rec[5], 0xffffffff) for rec in records)).tobytes(),
+                     array('H', (zone_ix[rec[2]] for rec in records)).tobytes(),
+                     array('H', (country_ix[rec[1]] for rec in records)).tobytes(),
+                     b''.join(tris), tri_starts.tobytes(),
+                     b''.join(postings[tri].tobytes() for tri in tris)))
+    header = struct.pack(HEADER, MAGIC, len(records), len(zones), len(countries),
+                         len(zones_b), len(countries_b), len(blob), len(tris), tri_starts[-1])
+
+    dname = os.path.dirname(fname)
+    if dname and not os.path.isdir(dname):
+        os.makedirs(dname)
+    with open(fname + '.tmp', 'wb') as f:
+        f.write(header + body)
+    os.replace(fname + '.tmp', fname)
+    return len(records)
+
+
+class Gazetteer:
+    """ The memory-mapped gazetteer, the arrays are views into the file.
+    """
+
+    def __init__(self, fname=GAZETTEER):
+        with open(fname, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, n, nz, nc, zlen, clen, blen, nt, npost) = struct.unpack_from(HEADER, self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{fname}: not a gazetteer')
+        self.n = n
+        view = memoryview(self.mm)
+        pos = struct.calcsize(HEADER)
+        self.zones = bytes(view[pos:pos+zlen]).decode().split('\0') if nz else []
+        pos += zlen
+        self.countries = bytes(view[pos:pos+clen]).decode().split('\0') if nc else []
+        pos += clen
+        self.blob = view[pos:pos+blen]
+        pos += blen
+        # views of the arrays, nothing is copied
+        def section(code, count):
+            nonlocal pos
+            size = struct.calcsize(code) * count
+            pos += size
+            return view[pos-size:pos].cast(code)
+        self.key_starts = section('I', n+1)
+        self.name_starts = section('I', n+1)
+        self.prefix = section('I', 257)
+        self.lat = section('f', n)
+        self.lon = section('f', n)
+        self.population = section('I', n)
+        self.zone = section('H', n)
+        self.country = section('H', n)
+        self.nt = nt
+        self.tris = view[pos:pos+3*nt]
+        pos += 3*nt
+        self.tri_starts = section('I', nt+1)
+        self.postings = section('I', npost)
+
+    def key(self, k):
+        return bytes(self.blob[self.key_starts[k]:self.key_starts[k+1]])
+
+    def record(self, k):
+        """ (name, country, zone, lat, lon) of record k.
+        """
+        name = bytes(self.blob[self.name_starts[k]:self.name_starts[k+1]]).decode()
+        return (name, self.countries[self.country[k]], self.zones[self.zone[k]],
+                round(self.lat[k], 2), round(self.lon[k], 2))
+
+    def posting(self, tri):
+        """ Records with the trigram, by bisect in the sorted trigrams.
+        """
+        a, b = 0, self.nt
+        while a < b:
+            m = (a + b) // 2
+            if bytes(self.tris[3*m:3*m+3]) < tri:
+                a = m + 1
+            else:
+                b = m
+        if a < self.nt and bytes(self.tris[3*a:3*a+3]) == tri:
+            return self.postings[self.tri_starts[a]:self.tri_starts[a+1]]
+        return ()
+
+    def candidates(self, key):
+        """ At most FUZZY records sharing the most trigrams with key.
+        """
+        counts = {}
+        for tri in trigrams(key.decode()):
+            for k in self.posting(tri):
+                counts[k] = counts.get(k, 0) + 1
+        return sorted(counts, key=lambda k: (-counts[k], -self.population[k]))[:FUZZY]
+
+    def prefix_range(self, key):
+        """ Records whose key starts with key: range of indices, by bisect in the prefix bucket.
+        No records for an empty key, like a name without Latin letters.
+        """
+        if not key:
+            return range(0)
+        lo, hi = self.prefix[key[0]], self.prefix[key[0]+1]
+        a, b = lo, hi
+        while a < b:
+            m = (a + b) // 2
+            if self.key(m) < key:
+                a = m + 1
+            else:
+                b = m
+        start = a
+        b = hi
+        while a < b:
+            m = (a + b) // 2
+            if self.key(m)[:len(key)] <= key:
+                a = m + 1
+            else:
+                b = m
+        return range(start, a)
+
+    def lookup(self, name, limit=5):
+        """ Records matching name: the prefix matches by population, then the close
+        matches among the trigram candidates, for typos. List of (name, country, zone, lat, lon).
+        """
+        key = normalize(name).encode()
+        found = sorted(self.prefix_range(key), key=lambda k: (self.key(k) != key, -self.population[k]))[:limit]
+        if len(found) < limit and key:
+            scored = []
+            for k in self.candidates(key):
+                if k in found:
+                    continue
+                ratio = difflib.SequenceMatcher(None, key, self.key(k)).ratio()
+                if ratio >= 0.75:
+                    scored.append((-ratio, -self.population[k], k))
+            found += [k for _, _, k in sorted(scored)[:limit - len(found)]]
+        return [self.record(k) for k in found]
+
+
+def tzlist_line(rec):
+    # a line ready to append to the tzlist
+    return f'{rec[2]}\t{rec[0]}\t{rec[1]}\t{rec[3]:.2f}\t{rec[4]:.2f}'
+
+
+def complete(gz, tzlist_file, out=sys.stdout, err=sys.stderr):
+    """ Bulk mode: validate and complete the configuration file.
+    Lines without coordinates, with invalid coordinates or with unknown zone get
+    the gazetteer values, mismatching zones are reported. The new configuration
+    is printed to out.
+    """
+    with open(tzlist_file, 'r') as f:
+        for n, raw in enumerate(f, 1):
+            line = raw.rstrip('\n')
+            if not line.strip() or line.lstrip()[0] == '#':
+                print(line, file=out)
+                continue
+            items = re.split('\t+', line.replace('"', ''))
+            if len(items) < 2:
+                print(line, file=out)
+                continue
+            found = gz.lookup(items[1], limit=1)
+            if not found:
+                print(f'{tzlist_file}:{n}: {items[1]} not in the gazetteer', file=err)
+                print(line, file=out)
+                continue
+            rec = found[0]
+            if normalize(rec[0]) != normalize(items[1]):
+                print(f'{tzlist_file}:{n}: {items[1]} is like {rec[0]}, {rec[1]}, not changed', file=err)
+                print(line, file=out)
+                continue
+            if items[0] not in pytz.all_timezones_set:
+                print(f'{tzlist_file}:{n}: {items[1]} unknown zone {items[0]}, {rec[2]} used', file=err)
+                items[0] = rec[2]
+            elif items[0] != rec[2]:
+                print(f'{tzlist_file}:{n}: {items[1]} zone {items[0]}, the gazetteer has {rec[2]}', file=err)
+            if len(items) < 3:
+                items.append(rec[1])
+            if len(items) >= 4:
+                try:
+                    coord.site_coords(items[3:5])
+                except ValueError as e:
+                    items[3:] = [f'{rec[3]:.2f}', f'{rec[4]:.2f}']
+                    print(f'{tzlist_file}:{n}: {items[1]} coordinates replaced, {e}', file=err)
+            else:
+                items[3:] = [f'{rec[3]:.2f}', f'{rec[4]:.2f}']
+                print(f'{tzlist_file}:{n}: {items[1]} coordinates added', file=err)
+            print('\t'.join(items), file=out)
+    return
+
+
+def open_gazetteer(fname=GAZETTEER, source=SOURCE):
+    """ The gazetteer, compiled from the source if it is missing or older.
+    """
+    if not os.path.isfile(fname) or (os.path.isfile(source) and os.path.getmtime(source) > os.path.getmtime(fname)):
+        build(read_source(source), fname)
+    try:
+        return Gazetteer(fname)
+    except (ValueError, struct.error):
+        # older or broken file
+        build(read_source(source), fname)
+        return Gazetteer(fname)
+
+
+if __name__ == '__main__':
+    gz_file = GAZETTEER
+    source = SOURCE
+    names = []
+    tzlist_file = None
+    limit = 5
+
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 gazetteer.py [-g gazetteer_file] [-s source] [-n count] city ...
+       python3 gazetteer.py [-g gazetteer_file] [-s source] -c tzlist_file
+    look up cities, the lines are ready to append to the configuration,
+    or validate and complete a configuration file (-c)
+    the source is {SOURCE} or a GeoNames cities*.txt file
+""", file=sys.stderr)
+            quit()
+        elif option == "-g" and i+1 < len(sys.argv):
+            i += 1
+            gz_file = sys.argv[i]
+        elif option == "-s" and i+1 < len(sys.argv):
+            i += 1
+            source = sys.argv[i]
+            build(read_source(source), gz_file)
+        elif option == "-n" and i+1 < len(sys.argv):
+            i += 1
+            limit = int(sys.argv[i])
+        elif option == "-c" and i+1 < len(sys.argv):
+            i += 1
+            tzlist_file = sys.argv[i]
+        else:
+            names.append(option)
+        i += 1
+
+    gz = open_gazetteer(gz_file, source)
+    if tzlist_file:
+        complete(gz, tzlist_file)
+    for name in names:
+        found = gz.lookup(name, limit)
+        if not found:
+            print(f'{name} not found', file=sys.stderr)
+        for rec in found:
+            print(tzlist_line(rec))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import math
+from array import array
+import tzrows
+
+""" Great-circle distances and initial bearings between the sites
+Haversine on the mean Earth radius. The sines and cosines of the coordinates
+are computed once, a row of the matrix is a few multiplications per point
+and it is cached; the matrices are cached by the coordinate set.
+"""
+
+RADIUS = 6371.0088   # km, mean Earth radius
+COMPASS = ('N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW')
+
+
+class DistanceMatrix:
+    """ Distances (km) and initial bearings (degrees) between points,
+    points are (lat, lon) or None, the rows are computed on first use.
+    """
+
+    def __init__(self, points):
+        self.points = tuple(points)
+        self.valid = [p is not None for p in self.points]
+        rad = [(math.radians(p[0]), math.radians(p[1])) if p else (0.0, 0.0) for p in self.points]
+        self.sin_lat = [math.sin(p[0]) for p in rad]
+        self.cos_lat = [math.cos(p[0]) for p in rad]
+        self.sin_lon = [math.sin(p[1]) for p in rad]
+        self.cos_lon = [math.cos(p[1]) for p in rad]
+        self.rows = {}
+
+    def row(self, i):
+        """ (distances, bearings) from point i to all points, array('d') each.
+        """
+        if i in self.rows:
+            return self.rows[i]
+        s1, c1, sl1, cl1 = self.sin_lat[i], self.cos_lat[i], self.sin_lon[i], self.cos_lon[i]
+        dist, bear = array('d'), array('d')
+        valid = self.valid[i]
+        for v2, s2, c2, sl2, cl2 in zip(self.valid, self.sin_lat, self.cos_lat, self.sin_lon, self.cos_lon):
+            if not (valid and v2):
+                dist.append(math.nan)
+                bear.append(math.nan)
+                continue
+            sin_dlon = sl2 * cl1 - cl2 * sl1
+            cos_dlon = cl2 * cl1 + sl2 * sl1
+            # haversine: sin^2(dlat/2) + cos lat1 cos lat2 sin^2(dlon/2), by the half-angle identities
+            h = (1.0 - (c1 * c2 + s1 * s2)) / 2 + c1 * c2 * (1.0 - cos_dlon) / 2
+            dist.append(2 * RADIUS * math.asin(math.sqrt(min(1.0, max(0.0, h)))))
+            bear.append(math.degrees(math.atan2(sin_dlon * c2, c1 * s2 - s1 * c2 * cos_dlon)) % 360)
+        self.rows[i] = (dist, bear)
+        return self.rows[i]
+
+    def distance(self, i, k):
+        return self.row(i)[0][k]
+
+    def bearing(self, i, k):
+        return self.row(i)[1][k]
+
+    def matrix(self):
+        """ All rows: list of (distances, bearings).
+        """
+        return [self.row(i) for i in range(len(self.points))]
+
+
+cache = {}   # coordinate set -> DistanceMatrix
+
+
+def distance_matrix(points):
+    """ The matrix of the points, cached by the coordinate set.
+    """
+    key = tuple(points)
+    if key not in cache:
+        if len(cache) >= 8:
+            cache.clear()
+        cache[key] = DistanceMatrix(key)
+    return cache[key]
+
+
+def compass(bearing):
+    return COMPASS[int((bearing + 22.5) // 45) % 8]
+
+
+def describe(dm, base, k, base_name):
+    """ Tooltip text: distance and bearing of point k from the base point, or ''.
+    """
+    d = dm.distance(base, k)
+    if math.isnan(d) or k == base:
+        return ''
+    b = dm.bearing(base, k)
+    return f'{d:,.0f} km, {b:.0f}° {compass(b)} from {base_name}'
+
+
+if __name__ == '__main__':
+    tzlist_file = tzrows.TZLIST
+    base = None
+
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 geodist.py [-t tzlist_file] [-b city]
+    distances and bearings between the sites with coordinates,
+    the full matrix, or relative to the base city (-b)
+""", file=sys.stderr)
+            quit()
+        elif option == "-t" and i+1 < len(sys.argv):
+            i += 1
+            if os.path.isfile(sys.argv[i]):
+                tzlist_file = sys.argv[i]
+        elif option == "-b" and i+1 < len(sys.argv):
+            i += 1
+            base = sys.argv[i]
+        i += 1
+
+    tzlist, home_index = tzrows.get_tzlist(tzlist_file, None)
+    names = [item[1].strip() for item in tzlist if item[3] is not None]
+    points = [(float(item[3]), float(item[4])) for item in tzlist if item[3] is not None]
+    if not points:
+        print(f'no coordinates in {tzlist_file}', file=sys.stderr)
+        quit()
+
+    dm = distance_matrix(points)
+    if base is not None:
+        if base not in names:
+            print(f'{base} has no coordinates in {tzlist_file}', file=sys.stderr)
+            quit()
+        b = names.index(base)
+        for k in range(len(names)):
+            if k != b:
+                print(f'{names[k]}\t{dm.distance(b, k):.0f}\t{dm.bearing(b, k):.0f}\t{compass(dm.bearing(b, k))}')
+    else:
+        print('km\t' + '\t'.join(names))
+        for k, (dist, bear) in enumerate(dm.matrix()):
+            print(names[k] + '\t' + '\t'.join(f'{d:.0f}' for d in dist))
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import re
+import mmap
+import time
+import datetime
+import tzlocal
+import coord
+import tzbundle
+import workcal
+import tzrows
+
+""" Headless kiosk export
+Paint the board of timez2.py into PNG or SVG files, or into a raw
+framebuffer file (like /dev/shm/timez.bgra), in every minute without
+a display server. Every row is one horizontal band of the frame, its
+content is compared with the previous frame: only the changed labels
+are painted again (the whole band if the phase changed), and the frame
+is not written if no row changed.
+PNG and framebuffer need pycairo, SVG is plain text.
+"""
+
+WIDTH = 520   # pixels of the office part, the sunlight part is SUN_WIDTH more
+SUN_WIDTH = 300
+ROW = 40   # pixels of a row, two lines
+FONTS = {'medium': 14, 'small': 11}
+
+# office: (x, line) of the labels, as attached in the office grid of timez2.py
+OFFICE = ((8, 0), (200, 0), (360, 0), (8, 1), (200, 1), (360, 1), (430, 1))
+
+
+def color(name):
+    """ (r, g, b) of the CSS and Pango color names of tzrows.py.
+    """
+    m = re.match(r'^gr[ae]y(\d+)$', name)
+    if m:
+        return (int(m.group(1)) / 100,) * 3
+    if name.startswith('#'):
+        return tuple(int(name[i:i+2], 16) / 255 for i in (1, 3, 5))
+    return {'navy blue': (0, 0, 0.5), 'medium blue': (0, 0, 0.8)}.get(name, (0, 0, 0))
+
+# background colors by phase, from the CSS of tzrows.py
+backgrounds = {m.group(1): color(m.group(2))
+               for m in re.finditer(r'#(\w+) \{ background: ([^;]+); \}', tzrows.css.decode())}
+
+
+class Board:
+    """ The rows of the configuration with the lazy columns of tzrows.py,
+    the owner of the rows instead of the window.
+    """
+
+    def __init__(self, tzlist_file, json_file, grids, workdays_file=workcal.WORKDAYS):
+        self.json_file = json_file
+        self.grids = grids
+        tzlist, self.home_index = tzrows.get_tzlist(tzlist_file, str(tzlocal.get_localzone()))
+        self.tzlist = [tzrows.Row(self, *item) for item in tzlist]
+        calendars = workcal.read_workdays(workdays_file)
+        for row in self.tzlist:
+            row.calendar = workcal.site_calendar(calendars, row.zone, row.city, row.country)
+        self.local_index = max(0, self.home_index)
+        self.json_mtime = None
+        self.sunrise_index = {}
+        self.utcnow = datetime.datetime.utcnow()
+        self.offsets = tzrows.OffsetMatrix([row.zone for row in self.tzlist])
+
+    def update(self, utcnow):
+        # the clock tick of the rows, and the sunrise dictionary if it was updated;
+        # a broken file (like req.py writing it) keeps the previous data until it changes again
+        mtime = os.path.getmtime(self.json_file) if os.path.isfile(self.json_file) else None
+        if mtime != self.json_mtime:
+            self.json_mtime = mtime
+            try:
+                self.sunrise_index = coord.grid_index(tzrows.get_dictionary(self.json_file))
+            except (OSError, ValueError) as e:
+                print(f'{self.json_file} not loaded, {e}', file=sys.stderr)
+            else:
+                for row in self.tzlist:
+                    row.invalidate('sunrise')
+        self.utcnow = utcnow
+        self.offsets.update(int((utcnow - tzbundle.EPOCH).total_seconds()))
+        for row in self.tzlist:
+            row.invalidate('time')
+
+    def cells(self):
+        """ Content of the rows, like redraw_gui shows them: list of
+        (office phase, [(text, colors) of the labels], sun phase, [(text, colors)] of the sunlight labels)
+        """
+        local_zone = self.tzlist[self.local_index].zone
+        cells = []
+        for k, row in enumerate(self.tzlist):
+            dt = row.get('dt')
+            phase = row.get('phase')
+            tupdict = tzrows.hicolors[phase] if (k == self.home_index or k == self.local_index) else tzrows.fgcolors[phase]
+            change = row.get('change')
+            badge = tzrows.change_badge(change, row.zone, local_zone)[0] if change else ''
+            texts = (row.city.strip(), row.get('now'), self.offsets.relative(local_zone, row.zone),
+                     row.country, dt.strftime('%a, %Y.%m.%d'), dt.tzname(), badge)
+            labels = [(text, tupdict[0 if n < 3 else 1]) for n, text in enumerate(texts)]
+            sun_phase, sun_labels = None, []
+            if self.grids == 2:
+                sun = row.get('sun')
+                state = row.get('sun_state')
+                sun_phase = state[1]
+                reverse = 'rest' if (sun_phase == 'twilight') else 'work'
+                sun_labels = [(state[0], tzrows.fgcolors[reverse][0]), (sun[0], tzrows.fgcolors[reverse][1])]
+            cells.append((phase, labels, sun_phase, sun_labels))
+        return cells
+
+
+def band(cell, grids):
+    # (x, x_end, line, text, colors) of the labels of a row, x_end is the next label or the end of the part
+    phase, labels, sun_phase, sun_labels = cell
+    items = []
+    for n, label in enumerate(labels):
+        x, line = OFFICE[n]
+        x_end = min([a for a, b in OFFICE if b == line and a > x] + [WIDTH])
+        items.append((x, x_end, line) + label)
+    if grids == 2:
+        items += [(WIDTH + 8, WIDTH + SUN_WIDTH, n) + label for n, label in enumerate(sun_labels)]
+    return items
+
+
+class CairoFrame:
+    """ The frame in a cairo image surface, PNG file or raw framebuffer file.
+    """
+
+    def __init__(self, rows, grids, png=None, fb=None):
+        import cairo
+        self.cairo = cairo
+        self.grids = grids
+        self.width = WIDTH + (SUN_WIDTH if grids == 2 else 0)
+        self.height = rows * ROW
+        self.surface = cairo.ImageSurface(cairo.FORMAT_RGB24, self.width, self.height)
+        self.png = png
+        self.fb = None
+        if fb:
+            size = self.surface.get_stride() * self.height
+            with open(fb, 'wb') as f:
+                f.truncate(size)
+            with open(fb, 'r+b') as f:
+                self.fb = mmap.mmap(f.fileno(), size)
+            print(f'{fb}: {self.width}x{self.height} BGRx, stride {self.surface.get_stride()}', file=sys.stderr)
+
+    def paint(self, dirty, cells, previous):
+        cr = self.cairo.Context(self.surface)
+        for k in dirty:
+            phase, labels, sun_phase, sun_labels = cells[k]
+            y = k * ROW
+            old = band(previous[k], self.grids) if previous[k] and previous[k][0::2] == cells[k][0::2] else None
+            if old is None:
+                cr.rectangle(0, y, WIDTH, ROW)
+                cr.set_source_rgb(*backgrounds[phase])
+                cr.fill()
+                if self.grids == 2:
+                    cr.rectangle(WIDTH, y, SUN_WIDTH, ROW)
+                    cr.set_source_rgb(*backgrounds[sun_phase])
+                    cr.fill()
+            for n, (x, x_end, line, text, (fg, face, size)) in enumerate(band(cells[k], self.grids)):
+                if old:
+                    if old[n][3:] == (text, (fg, face, size)):
+                        continue
+                    # clear the label only
+                    cr.rectangle(x, y + line * ROW // 2, x_end - x, ROW // 2)
+                    cr.set_source_rgb(*backgrounds[phase if x < WIDTH else sun_phase])
+                    cr.fill()
+                cr.select_font_face(face)
+                cr.set_font_size(FONTS[size])
+                cr.set_source_rgb(*color(fg))
+                cr.move_to(x, y + 16 + line * 18)
+                cr.show_text(text)
+        self.surface.flush()
+
+    def write(self, dirty):
+        if self.png:
+            self.surface.write_to_png(self.png + '.tmp')
+            os.replace(self.png + '.tmp', self.png)
+        if self.fb:
+            # only the bands of the changed rows are copied
+            data = self.surface.get_data()
+            stride = self.surface.get_stride()
+            for k in dirty:
+                a, b = k * ROW * stride, (k + 1) * ROW * stride
+                self.fb[a:b] = data[a:b]
+
+
+class SvgFrame:
+    """ The frame as SVG text, the fragments of the unchanged rows are reused.
+    """
+
+    def __init__(self, rows, grids, svg):
+        self.grids = grids
+        self.width = WIDTH + (SUN_WIDTH if grids == 2 else 0)
+        self.height = rows * ROW
+        self.svg = svg
+        self.fragments = [''] * rows
+
+    def paint(self, dirty, cells, previous):
+        for k in dirty:
+            phase, labels, sun_phase, sun_labels = cells[k]
+            y = k * ROW
+            parts = [f'<rect x="0" y="{y}" width="{WIDTH}" height="{ROW}" fill="{rgb(backgrounds[phase])}"/>']
+            if self.grids == 2:
+                parts.append(f'<rect x="{WIDTH}" y="{y}" width="{SUN_WIDTH}" height="{ROW}" '
+                             f'fill="{rgb(backgrounds[sun_phase])}"/>')
+            for x, x_end, line, text, (fg, face, size) in band(cells[k], self.grids):
+                text = text.replace('&', '&amp;').replace('<', '&lt;')
+                parts.append(f'<text x="{x}" y="{y + 16 + line * 18}" font-family="{face}" '
+                             f'font-size="{FONTS[size]}" fill="{rgb(color(fg))}" xml:space="preserve">{text}</text>')
+            self.fragments[k] = '\n'.join(parts)
+
+    def write(self, dirty):
+        with open(self.svg + '.tmp', 'w') as f:
+            f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}">\n')
+            f.write('\n'.join(self.fragments))
+            f.write('\n</svg>\n')
+        os.replace(self.svg + '.tmp', self.svg)
+
+
+def rgb(c):
+    return '#%02x%02x%02x' % tuple(round(v * 255) for v in c)
+
+
+class Kiosk:
+    """ Paint the changed rows into the frames, write only changed frames.
+    """
+
+    def __init__(self, board, frames):
+        self.board = board
+        self.frames = frames
+        self.previous = [None] * len(board.tzlist)
+        self.written = 0
+        self.skipped = 0
+
+    def frame(self, utcnow):
+        """ Update the frames for utcnow, return the number of repainted rows.
+        """
+        self.board.update(utcnow)
+        cells = self.board.cells()
+        dirty = [k for k in range(len(cells)) if cells[k] != self.previous[k]]
+        if not dirty:
+            self.skipped += 1
+            return 0
+        for frame in self.frames:
+            frame.paint(dirty, cells, self.previous)
+            frame.write(dirty)
+        self.previous = cells
+        self.written += 1
+        return len(dirty)
+
+
+if __name__ == '__main__':
+    tzlist_file = tzrows.TZLIST
+    json_file = tzrows.JSONFILE
+    workdays_file = tzrows.WORKDAYS
+    grids = 1
+    png, svg, fb = None, None, None
+    once = False
+
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 kiosk.py [-t tzlist_file] [-j json_file] [-w workdays_file] [-2.0] [--png file] [--svg file] [--fb file] [-1]
+    paint the board into image files in every minute, without display
+    options:
+        --png  PNG file, needs pycairo
+        --svg  SVG file
+        --fb   raw BGRx framebuffer file, like /dev/shm/timez.bgra, needs pycairo
+        -1     one frame and exit
+""", file=sys.stderr)
+            quit()
+        elif option == "-t" and i+1 < len(sys.argv):
+            i += 1
+            if os.path.isfile(sys.argv[i]):
+                tzlist_file = sys.argv[i]
+        elif option == "-j" and i+1 < len(sys.argv):
+            i += 1
+            json_file = sys.argv[i]
+        elif option == "-w" and i+1 < len(sys.argv):
+            i += 1
+            workdays_file = sys.argv[i]
+        elif option == "-2.0":
+            grids = 2
+        elif option == "--png" and i+1 < len(sys.argv):
+            i += 1
+            png = sys.argv[i]
+        elif option == "--svg" and i+1 < len(sys.argv):
+            i += 1
+            svg = sys.argv[i]
+        elif option == "--fb" and i+1 < len(sys.argv):
+            i += 1
+            fb = sys.argv[i]
+        elif option == "-1":
+            once = True
+        i += 1
+
+    if not (png or svg or fb):
+        print('no output, see -h', file=sys.stderr)
+        quit()
+    board = Board(tzlist_file, json_file, grids, workdays_file)
+    frames = []
+    if png or fb:
+        try:
+            frames.append(CairoFrame(len(board.tzlist), grids, png, fb))
+        except ImportError:
+            print('PNG and framebuffer output need pycairo', file=sys.stderr)
+            quit()
+    if svg:
+        frames.append(SvgFrame(len(board.tzlist), grids, svg))
+
+    kiosk = Kiosk(board, frames)
+    try:
+        while True:
+            kiosk.frame(datetime.datetime.utcnow())
+            if once:
+                break
+            # wake up at the next minute
+            time.sleep(60 - time.time() % 60 + 0.05)
+    except KeyboardInterrupt:
+        pass
+    print(f'{kiosk.written} frames written, {kiosk.skipped} identical frames skipped', file=sys.stderr)
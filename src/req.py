@@ -20,6 +20,16 @@ import time
 import re
 import json
 import requests
+import coord
+
+API = 'https://api.sunrise-sunset.org/json'
+TIMEOUT = 10   # seconds for one query
+BACKOFF = (600, 7*24*3600)   # first retry delay and the limit, seconds; doubled after each failure
+BREAKER = 5   # consecutive transient failures stop the run
+NEGATIVE_TTL = 30*24*3600   # rejected coordinates are not queried again for this time
+
+# API status values of permanent failures, the others are transient
+PERMANENT = ('INVALID_REQUEST', 'INVALID_DATE', 'INVALID_TZID')
 
 
 def json_load(fname):
@@ -36,44 +46,133 @@ def json_dump(di, fname):
     return
 
 
-def req(D, lat, lon, forced=False):
-    """ Update Sunrise-Sunset dictionary with key (lat, lon).
-        The update is requested if the data is missing, outdated or forced.
+def grid_dict(D):
+    """ Rekey the dictionary by grid cells, entries of the same cell are merged.
     """
-    baseURL = f'https://api.sunrise-sunset.org/json?lat={lat}&lng={lon}&formatted=0'
+    return {coord.key_of_cell(c): entry for c, entry in coord.grid_index(D).items()}
+
+
+class Failures:
+    """ Failure records by key, saved next to the dictionary,
+    and the circuit breaker of the run.
+    record: {'count': n, 'next': epoch seconds, 'permanent': bool, 'reason': str}
+    """
+
+    def __init__(self, fname=None):
+        self.fname = fname
+        self.records = {}
+        self.consecutive = 0
+        if fname and os.path.isfile(fname):
+            with open(fname, 'r') as f:
+                self.records = json.load(f)
+
+    def open(self):
+        # the breaker is open, no more requests in this run
+        return self.consecutive >= BREAKER
 
-    key = f'{lat};{lon}'
+    def blocked(self, key, now):
+        """ Return 'negative' or 'backoff' if key shall not be queried now, else None.
+        """
+        rec = self.records.get(key)
+        if rec is None or rec['next'] <= now:
+            return None
+        return 'negative' if rec['permanent'] else 'backoff'
+
+    def failed(self, key, reason, permanent, now):
+        rec = self.records.setdefault(key, {'count': 0})
+        rec['count'] += 1
+        rec['permanent'] = permanent
+        rec['reason'] = reason
+        if permanent:
+            rec['next'] = now + NEGATIVE_TTL
+        else:
+            rec['next'] = now + min(BACKOFF[0] * 2 ** (rec['count'] - 1), BACKOFF[1])
+            self.consecutive += 1
+
+    def succeeded(self, key):
+        self.records.pop(key, None)
+        self.consecutive = 0
+
+    def save(self):
+        if self.fname:
+            json_dump(self.records, self.fname)
+
+
+def query(lat, lon, url=API):
+    """ Query the API, return (results, None) or (None, (reason, permanent)).
+    """
+    try:
+        response = requests.get(url, params={'lat': lat, 'lng': lon, 'formatted': 0}, timeout=TIMEOUT)
+    except requests.Timeout:
+        return None, ('timeout', False)
+    except requests.RequestException as e:
+        return None, (f'{type(e).__name__}', False)
+
+    try:
+        resp_json = response.json()
+        status = resp_json['status']
+    except (ValueError, KeyError, TypeError):
+        status = None
+    if status == 'OK' and response.status_code == 200:
+        return resp_json['results'], None
+    if status in PERMANENT:
+        return None, (status, True)
+    if response.status_code == 400:
+        return None, (f'HTTP {response.status_code}', True)
+    if status is None and response.status_code == 200:
+        return None, ('invalid answer', False)
+    return None, (status or f'HTTP {response.status_code}', False)
+
+
+def req(D, lat, lon, forced=False, failures=None, url=API):
+    """ Update Sunrise-Sunset dictionary with the grid cell key of (lat, lon).
+        The update is requested if the data is missing, outdated or forced,
+        and the key is not blocked by the failure records or the breaker.
+        Return 'updated', 'up-to-date', 'backoff', 'negative', 'breaker',
+        'transient' or 'permanent'.
+    """
+    failures = failures if failures is not None else Failures()
+    key = coord.cell_key(float(lat), float(lon))
     timestamp = time.strftime('%Y.%m.%d %H:%M:%S', time.gmtime())
+    now = int(time.time())
 
     if (key in D) and (D[key]['timestamp'] >= timestamp) and not forced:
         print(f'({lat}, {lon}) ... up-to-date')
-        return False
+        return 'up-to-date'
 
-    try:
-        response = requests.get(baseURL)
-        resp_json = response.json()
-        assert resp_json['status'] == 'OK'
-    except Exception:
-        print(f'({lat}, {lon}) query failed', file=sys.stderr)
-        return False
+    blocked = failures.blocked(key, now)
+    if blocked and not forced:
+        print(f'({lat}, {lon}) ... skipped, {blocked}: {failures.records[key]["reason"]}')
+        return blocked
+    if failures.open():
+        return 'breaker'
+
+    results, error = query(lat, lon, url)
+    if error:
+        reason, permanent = error
+        failures.failed(key, reason, permanent, now)
+        print(f'({lat}, {lon}) query failed, {reason}' + (', rejected' if permanent else ''), file=sys.stderr)
+        return 'permanent' if permanent else 'transient'
+    failures.succeeded(key)
 
     if key not in D:
         D[key] = {}
 
-    if 'result' in D[key] and (D[key]['result'] == resp_json['results']):
+    if 'result' in D[key] and (D[key]['result'] == results):
         print(f'({lat}, {lon}) ... same values, {timestamp}')
     else:
         print(f'({lat}, {lon}) ... values updated, {timestamp}')
-    D[key]['result'] = resp_json['results']
+    D[key]['result'] = results
     D[key]['timestamp'] = timestamp
 
-    return True
+    return 'updated'
 
 
-def refresh_json(fn_json, fname=None, all_update=False, force_update=False):
+def refresh_json(fn_json, fname=None, all_update=False, force_update=False, url=API):
     D = {}
     if fn_json and os.path.isfile(fn_json):
-        D = json_load(fn_json)
+        D = grid_dict(json_load(fn_json))
+    failures = Failures(os.path.splitext(fn_json)[0] + '-failures.json' if fn_json else None)
 
     L = []
     if all_update:
@@ -88,35 +187,47 @@ def refresh_json(fn_json, fname=None, all_update=False, force_update=False):
                     continue
                 line = line.replace('"', '')
                 items = re.split('\t+', line)
-                lat, lon = None, None
-                for item in items:
-                    if re.match(r'^-?[0-9]+\.[0-9]+$', item):
-                        if not lat:
-                            lat = item
-                        elif not lon:
-                            lon = item
-                    if lat and lon:
-                        L.append((lat, lon))
-                        break
+                if len(items) < 4:
+                    continue
+                try:
+                    L.append(coord.site_coords(items[3:5]))
+                except ValueError as e:
+                    print(f'{items[1]} {e}', file=sys.stderr)
         print(f"{len(L)} keys from {fname}")
 
     if len(L) == 0:
         print(f"no keys for update, nothing to do")
         return
 
-    uc = 0
+    # one query for the locations in the same grid cell
+    cells = {}
     for k in L:
-        if req(D, k[0], k[1], force_update):
-            uc += 1
-    print(f"{uc} keys updated")
+        cells.setdefault(coord.cell(float(k[0]), float(k[1])), k)
+    if len(cells) < len(L):
+        print(f"{len(L) - len(cells)} keys in the same grid cell, skipped")
+    L = list(cells.values())
+
+    counts = {}
+    for k in L:
+        status = req(D, k[0], k[1], force_update, failures, url)
+        counts[status] = counts.get(status, 0) + 1
+    print(f"{counts.get('updated', 0)} keys updated, {counts.get('up-to-date', 0)} up-to-date")
+    if counts.get('transient') or counts.get('backoff') or counts.get('breaker'):
+        print(f"transient failures: {counts.get('transient', 0)} failed, "
+              f"{counts.get('backoff', 0)} in backoff, {counts.get('breaker', 0)} skipped by the breaker")
+    if counts.get('permanent') or counts.get('negative'):
+        print(f"permanent failures: {counts.get('permanent', 0)} rejected, "
+              f"{counts.get('negative', 0)} in the negative cache")
 
     json_dump(D, fn_json)
+    failures.save()
     return
 
 
 if __name__ == '__main__':
     json_file = os.environ.get('HOME') + '/.config/TimeZ/sunrise-sunset.json'
-    input_list = os.environ.get('HOME') + '/.timez'
+    import tzrows
+    input_list = tzrows.TZLIST
 
     kwargs = {}
     i = 1
@@ -124,10 +235,11 @@ if __name__ == '__main__':
         option = sys.argv[i]
         if option == "-h":
             print(f"""
-Usage: python3 req.py [-j json_file] [-t tzlist_file] --force --all
+Usage: python3 req.py [-j json_file] [-t tzlist_file] [-u api_url] --force --all
     options:
         --all  update all keys in dict, do not read tzlist
-        --force  update all keys in dict, even if timestamp up-to-date
+        --force  update all keys in dict, even if timestamp up-to-date or failed recently
+        -u  API URL, default {API}
 """, file=sys.stderr)
             quit()
         elif option == "-j" and i+1 < len(sys.argv):
@@ -138,6 +250,9 @@ Usage: python3 req.py [-j json_file] [-t tzlist_file] --force --all
             i += 1
             if os.path.isfile(sys.argv[i]):
                 kwargs['fname'] = sys.argv[i]
+        elif option == "-u" and i+1 < len(sys.argv):
+            i += 1
+            kwargs['url'] = sys.argv[i]
         elif option == "--all":
                 kwargs['all_update'] = True
         elif option == "--force":
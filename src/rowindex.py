@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import re
+
+""" Row index for the type-to-filter search
+Terms of 1 or 2 characters match the word prefixes, longer terms match
+substrings: the trigram postings are intersected and the candidates
+are verified. The terms of a query are ANDed.
+"""
+
+WORD = re.compile(r'[\s/_,.()-]+')
+OFFSET = re.compile(r'^(utc)?([+-]?\d[\d:]*|0)$')   # UTC offset term, like +5:30 or utc-3
+
+
+def kind(term):
+    # how the term matches: UTC offset, word prefix or substring
+    if OFFSET.match(term):
+        return 'offset'
+    return 'prefix' if len(term) < 3 else 'substring'
+
+
+def narrows(old, new):
+    """ The rows of the new query are within the rows of the old query,
+    the search can start from the old result: the terms only grow
+    and keep their kind (a term of 3 characters is not a word prefix).
+    """
+    if not old or not new.lower().startswith(old.lower()):
+        return False
+    return all(kind(a) == kind(b) for a, b in zip(old.lower().split(), new.lower().split()))
+
+
+class RowIndex:
+
+    def __init__(self, texts):
+        self.texts = [text.lower() for text in texts]
+        self.prefixes = {}   # word prefix of 1-2 characters -> set of rows
+        self.trigrams = {}   # trigram -> set of rows
+        for k, text in enumerate(self.texts):
+            for word in WORD.split(text):
+                for n in (1, 2):
+                    if len(word) >= n:
+                        self.prefixes.setdefault(word[:n], set()).add(k)
+            for i in range(len(text) - 2):
+                self.trigrams.setdefault(text[i:i+3], set()).add(k)
+
+    def term(self, term):
+        """ Set of rows matching one lower case term.
+        """
+        if len(term) < 3:
+            return self.prefixes.get(term, set())
+        postings = sorted((self.trigrams.get(term[i:i+3], set()) for i in range(len(term) - 2)), key=len)
+        if not postings[0]:
+            return set()
+        candidates = postings[0].intersection(*postings[1:])
+        return {k for k in candidates if term in self.texts[k]}
+
+    def search(self, query, rows=None):
+        """ Set of rows matching all terms of query, within rows if given.
+        """
+        result = set(range(len(self.texts))) if rows is None else set(rows)
+        for term in query.lower().split():
+            result &= self.term(term)
+            if not result:
+                break
+        return result
+
+
+if __name__ == '__main__':
+    index = RowIndex(['Pacific/Auckland Auckland New Zealand',
+                      'Europe/Budapest Budapest Hungary',
+                      'America/New_York New York US'])
+    for query in ('bu', 'new', 'new york', 'zeal', 'u', 'x'):
+        print(f'{query!r} -> {sorted(index.search(query))}')
+
+    # typing one key at a time gives the same rows as the query in one go
+    for query in ('dap', 'oky', 'new yo', 'ew zeal', 'bud hun'):
+        rows, old = None, ''
+        for n in range(1, len(query) + 1):
+            rows = index.search(query[:n], rows if narrows(old, query[:n]) else None)
+            old = query[:n]
+        assert rows == index.search(query), query
+    print('incremental search ok')
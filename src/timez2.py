@@ -14,20 +14,24 @@ import os
 import sys
 import tzlocal
 import datetime
-import pytz
-import re
-import json
+import threading
 import gi
+import tzbundle
+import coord
+import rowindex
+import geodist
+import workcal
+import tzrows
 
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib
 from gi.repository.GdkPixbuf import Pixbuf
 
-TZLIST = os.environ.get('HOME') + '/.timez'
-# see /usr/share/zoneinfo or pytz.all_timezones
-coretime = (9, 17)   # office core time; [from, before)
-daylight = (7, 19)   # potential work hours, the rest is night
-JSONFILE = os.environ.get('HOME') + '/.config/TimeZ/sunrise-sunset.json'
+TZLIST = tzrows.TZLIST
+idle = 0   # minutes between the redraws without focus, 0: every minute
+JSONFILE = tzrows.JSONFILE
+TZBUNDLE = tzrows.TZBUNDLE
+WORKDAYS = tzrows.WORKDAYS
 
 icons = {'UTC':'emblem-web',
          'home':'gtk-home',
@@ -35,173 +39,69 @@ icons = {'UTC':'emblem-web',
          'twilight':'numix-weather-fog',
          'night':'tango-weather-clear-night'}
 
-# bg colors by phase -- use CSS
-css = b'''
-    #work { background: grey97; }
-    #day { background: grey75; }
-    #rest { background: grey42; }
-    #sunlight { background: #B1DAE7; }
-    #twilight { background: #63B4CF; }
-    #night { background: #316577; }
-'''
-
-# (foreground, face, size) font attributes for the 1st and 2nd line, normal labels
-fgcolors = {'work': (('grey17', 'monospace', 'medium'), ('grey53', 'sans', 'small')),
-            'day':  (('grey11', 'monospace', 'medium'), ('grey42', 'sans', 'small')),
-            'rest': (('grey5', 'monospace', 'medium'),  ('grey23', 'sans', 'small'))}
-hicolors = {'work': (('navy blue', 'monospace', 'medium'), ('medium blue', 'sans', 'small')),
-            'day':  (('navy blue', 'monospace', 'medium'), ('medium blue', 'sans', 'small')),
-            'rest': (('navy blue', 'monospace', 'medium'), ('navy blue',   'sans', 'small'))}
-
 def usage():
     print(f"""
-Usage: python3 timez.py [[-t] configuration_file] [-j json_dictionary_file]
+Usage: python3 timez.py [[-t] configuration_file] [-j json_dictionary_file] [-w workdays_file] [-r radar_days] [-i idle_minutes] [-s] [-o]
     default configuration: {TZLIST}
     default dictionary: {JSONFILE}
+    default working calendars: {WORKDAYS}
 """, file=sys.stderr)
     quit()
 
-def something_like_usage(reason, fn=None):
-    if reason == 'enoent' or reason == 'empty':
-        if reason == 'enoent':
-            print(f'Configuration file [{fn}] does not exist', file=sys.stderr)
-        elif reason == 'empty':
-            print(f'Configuration file [{fn}] has no configuration', file=sys.stderr)
-        print("""
->>> This file should contain something like this:
-# lines in this file must have TAB separated fields,
-# and at least 3 items: Zone City Country (optional coordinates: Lat Lon)
-Pacific/Auckland	Auckland	New Zealand	-36.84	174.76
-Europe/Budapest		Budapest	Hungary		47.49	19.04
-America/Halifax		Halifax		Canada		44.65	-63.58
->>> Have fun!
-""", file=sys.stderr)
-    quit()
-
-def get_tzlist(tzlist_file, home_zone):
-    """ Parse the configuration file.
-    Must be TAB separated items: zone, city, country, lat, lon
-    Skip empty and comment lines. Double quotes will be removed, TABs squeezed.
-    Return the configuration list and the index of first item with home_zone.
+class RowGui:
+    """ Widget references of one row, for the updates.
     """
-    if not os.path.isfile(tzlist_file):
-        something_like_usage('enoent', tzlist_file)
-
-    tzlist = []
-    utcnow = datetime.datetime.utcnow()
-    home_index = -1
-    with open(tzlist_file, 'r') as f:
-        for raw in f:
-            line = raw.strip()
-            if len(line) == 0 or re.match(r'^[ \t]*#|[ \t]*$', line):
-                continue
-            line = line.replace('"', '')
-            items = re.split('\t+', line)
-            if len(items) >= 5:
-                (zone, city, country, lat, lon) = items[:5]
-            elif len(items) >= 3:
-                (zone, city, country) = items[:3]
-                lat, lon = None, None
-            else:
-                continue
-            try:
-                offset = base_offset(utcnow, zone)
-            except pytz.UnknownTimeZoneError:
-                print(f'Error: {zone} ignored', file=sys.stderr)
-                continue
-            tzlist.append([zone, city, country, lat, lon])
-            if home_index == -1 and zone == home_zone:
-                home_index = len(tzlist)-1
-
-    if len(tzlist) == 0:
-        something_like_usage('empty', tzlist_file)
-    clen = max(14, max(( len(item[1]) for item in tzlist )))
-    for item in tzlist:
-        item[1] = (item[1]+" "*clen)[:clen]
-
-    return (tzlist, home_index)
-
-def get_dictionary(json_file):
-    """ Load the dictionary from JSON file.
-    """
-    if os.path.isfile(json_file):
-        with open(json_file, 'r') as f:
-            sunrise_dict = json.load(f)
-    else:
-        sunrise_dict = {}
-    return sunrise_dict
-
-def get_sunrize_sunset(sunrise_dict, zone, lat, lon):
-    """ Calculate static "%H:%M" values for (lat, lon) based on the information in sunrise dictionary.
-    """
-    cs = f'({float(lat):.2f}, {float(lon):.2f})' if (lat and lon) else ''
-    r, s, b, e = '', '', '', ''
-
-    key = f'{lat};{lon}'
-    if key in sunrise_dict:
-        ans = sunrise_dict[key]['result']
-
-        dlen = ans['day_length']
-        if dlen > 0:
-            sunrise = datetime.datetime.fromisoformat( ans['sunrise'] )
-            sunset = datetime.datetime.fromisoformat( ans['sunset'] )
-            r = sunrise.astimezone( pytz.timezone(zone) ).strftime("%H:%M")
-            s = sunset.astimezone( pytz.timezone(zone) ).strftime("%H:%M")
-
-        beg = datetime.datetime.fromisoformat( ans['civil_twilight_begin'] )
-        end = datetime.datetime.fromisoformat( ans['civil_twilight_end'] )
-        tlen = int((end - beg).total_seconds())
-        if tlen > 0:
-            b = beg.astimezone( pytz.timezone(zone) ).strftime("%H:%M")
-            e = end.astimezone( pytz.timezone(zone) ).strftime("%H:%M")
-
-        text = f'Lat {lat} Long {lon}\n' + '\n'.join((f'  {k} {v}' for k, v in ans.items()))
-    else:
-        text = f'Lat {lat} Long {lon}\n' + '  not found'
-
-    return [cs, r, s, b, e, text]
-
-def base_offset(utcnow, zone):
-    """ Calculate the actual offset in minutes from UTC.
-    """
-    dt = pytz.utc.localize( utcnow ).astimezone( pytz.timezone(zone) )
-    return dt.utcoffset().days * 24*60 + dt.utcoffset().seconds // 60
-
-def rel_offset(baseoff, target):
-    """ Calculate the relative offset and return formatted string.
-    """
-    off = target - baseoff
-    if off == 0:
-        s = '0'
-    elif off % 60 == 0:
-        s = '%+d' % (off//60)
-    elif off < 0:
-        off = -off
-        s = '-%d:%02d' % (off//60, off%60)
-    else:
-        s = '+%d:%02d' % (off//60, off%60)
-    return s
+    __slots__ = ('evbox', 'office_grid', 'office_iv', 'office_ls', 'labels',
+                 'sunlight_grid', 'sunlight_iv', 'sunlight_ls', 'time_fmt')
+
+    def __init__(self, evbox, office_grid, office_iv, office_ls, labels, sunlight_grid, sunlight_iv, sunlight_ls):
+        self.evbox = evbox
+        self.office_grid = office_grid
+        self.office_iv = office_iv
+        self.office_ls = office_ls
+        self.labels = labels
+        self.sunlight_grid = sunlight_grid
+        self.sunlight_iv = sunlight_iv
+        self.sunlight_ls = sunlight_ls
+        self.time_fmt = '%s'   # markup of the time label, for the seconds
 
 class TimesWindow(Gtk.Window):
 
-    def __init__(self, tzlist_file, json_file, grids):
+    def __init__(self, tzlist_file, json_file, grids, workdays_file=WORKDAYS, by_offset=False):
         Gtk.Window.__init__(self, title='TimeZ')
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
         self.add(vbox)
+        self.vbox = vbox
 
         self.tzlist_file = tzlist_file
         self.json_file = json_file
         self.grids = grids
         self.sunrise_dict = {}
+        self.sunrise_index = {}   # grid cell -> sunrise dictionary entry
+        self.json_mtime = None
+        self.loading = False   # background reload is running
+        self.progress = ''
+        self.filtering = False   # type-to-filter mode
+        self.query = ''
+        self.index = None
+        self.distances = None   # great-circle distances between the rows with coordinates
+        self.offsets = None   # UTC offsets and the relative offsets of the rows
+        self.by_offset = by_offset   # rows sorted East to West by the current offset
         self.tzlist = []
         self.home_index = -1
         self.local_index = 0
-        self.gui = []
+        self.mapped = False   # visibility: the redraws are suspended while hidden
+        self.iconified = False
+        self.obscured = False
+        self.focused = True
+        self.stale = False   # a redraw was skipped, catch up when visible
+        self.skipped = 0
+        self.tooltip_skipped = 0   # skipped count of the window tooltip
 
         # CSS for the background color changes
         screen = Gdk.Screen.get_default()
         style_provider = Gtk.CssProvider()
-        style_provider.load_from_data(css)
+        style_provider.load_from_data(tzrows.css)
         style_context = Gtk.StyleContext()
         style_context.add_provider_for_screen(screen, style_provider,
                 Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
@@ -213,19 +113,26 @@ class TimesWindow(Gtk.Window):
         self.twilight_icon = Gtk.IconTheme.get_default().load_icon(icons['twilight'], 24, 0)
         self.night_icon = Gtk.IconTheme.get_default().load_icon(icons['night'], 24, 0)
 
-        # common tooltip for the office grid
-        tooltip = (f'office / work hours\n'
-                   f'core time {coretime[0]} - {coretime[1]}\n'
-                   f'day light {daylight[0]} - {daylight[1]}\n')
-        self.set_tooltip_text(tooltip)
-
         # get configuration files
-        self.tzlist, self.home_index = get_tzlist( self.tzlist_file, tzlocal.get_localzone().zone )
+        tzlist, self.home_index = tzrows.get_tzlist( self.tzlist_file, tzlocal.get_localzone().zone )
+        self.tzlist = [tzrows.Row(self, *item) for item in tzlist]
+        calendars = workcal.read_workdays(workdays_file)
+        for row in self.tzlist:
+            row.calendar = workcal.site_calendar(calendars, row.zone, row.city, row.country)
+
+        # common tooltip for the office grid
+        self.set_tooltip_text(self.window_tooltip())
+        self.index = rowindex.RowIndex([f'{row.zone} {row.city} {row.country}' for row in self.tzlist])
         self.local_index = max(0, self.home_index)
+        self.distances = geodist.distance_matrix([(row.lat, row.lon) if row.lat is not None and row.lon is not None
+                                                  else None for row in self.tzlist])
+        self.utcnow = datetime.datetime.utcnow()
+        self.offsets = tzrows.OffsetMatrix([row.zone for row in self.tzlist])
+        self.offsets.update(int((self.utcnow - tzbundle.EPOCH).total_seconds()))
         self.json_reload()
 
         # initialize to GUI
-        # add each evbox to vbox and save evbox and its content to self.gui
+        # add each evbox to vbox and save evbox and its content to the row
         for k in range(len(self.tzlist)):
             # one evbox for each row
             evbox = Gtk.EventBox()
@@ -277,6 +184,7 @@ class TimesWindow(Gtk.Window):
                       Gtk.Label(label=' ', xalign=0), \
                       Gtk.Label(label=' ', xalign=0), \
                       Gtk.Label(label=' ', xalign=0), \
+                      Gtk.Label(label=' ', xalign=0), \
                       Gtk.Label(label=' ', xalign=0)]
 
             # two grids for different CSS
@@ -287,138 +195,198 @@ class TimesWindow(Gtk.Window):
             office_grid.attach(labels[3], 1, 1, 1, 1)
             office_grid.attach(labels[4], 2, 1, 1, 1)
             office_grid.attach(labels[5], 3, 1, 1, 1)
+            office_grid.attach(labels[8], 4, 1, 1, 1)   # the offset change badge
             sunlight_grid.attach(sunlight_iv, 0, 0, 1, 2)
             sunlight_grid.attach(labels[6], 1, 0, 1, 1)
             sunlight_grid.attach(labels[7], 1, 1, 1, 1)
 
+            # the distance, badge and sunlight tooltips are generated on demand
+            labels[0].set_has_tooltip(True)
+            labels[0].connect('query-tooltip', self.on_query_tooltip, (k, 'distance'))
+            labels[8].set_has_tooltip(True)
+            labels[8].connect('query-tooltip', self.on_query_tooltip, (k, 'change'))
+            if self.grids == 2:
+                labels[6].set_has_tooltip(True)
+                labels[6].connect('query-tooltip', self.on_query_tooltip, (k, 'sun_state'))
+                labels[7].set_has_tooltip(True)
+                labels[7].connect('query-tooltip', self.on_query_tooltip, (k, 'ddump'))
+
             # Gtk.Window -> Gtk.Box -> [ Gtk.EventBox -> Gtk.Grid() ]
             evbox.add(grid)
             evbox.connect('button-press-event', self.on_click, k)
-            evbox.connect('key-press-event', self.keyb_input, None)
             vbox.pack_start(evbox, expand=True, fill=True, padding=0)
 
             # save references for the updates
-            self.gui.append([evbox, office_grid, office_iv, office_ls, labels, sunlight_grid, sunlight_iv, sunlight_ls])
-
-        self.utcnow = datetime.datetime.utcnow()
+            self.tzlist[k].gui = RowGui(evbox, office_grid, office_iv, office_ls, labels, sunlight_grid, sunlight_iv, sunlight_ls)
+
+        if self.by_offset:
+            self.order_rows()
+        self.connect('key-press-event', self.keyb_input, None)
+        # visibility and focus, for the refresh throttling
+        self.add_events(Gdk.EventMask.VISIBILITY_NOTIFY_MASK)
+        self.connect('map-event', self.on_visibility, 'map')
+        self.connect('unmap-event', self.on_visibility, 'unmap')
+        self.connect('window-state-event', self.on_visibility, 'state')
+        self.connect('visibility-notify-event', self.on_visibility, 'notify')
+        self.connect('focus-in-event', self.on_visibility, 'focus-in')
+        self.connect('focus-out-event', self.on_visibility, 'focus-out')
         self.redraw_gui()
         return
 
-    def json_reload(self):
-        """ Reload dictionary from JSON file and update tzlist structure.
+    def window_tooltip(self):
+        # the working calendars of the sites, the same calendar on one line
+        sites = {}
+        for row in self.tzlist:
+            sites.setdefault(row.calendar, []).append(row.city.strip())
+        tooltip = 'office / work hours\n'
+        for cal, cities in sites.items():
+            weekend = ','.join(workcal.DAYS[d].capitalize() for d in sorted(cal.weekend)) or 'no weekend'
+            more = f' +{len(cities) - 3}' if len(cities) > 3 else ''
+            tooltip += (f'core time {cal.coretime[0]} - {cal.coretime[1]}, day light {cal.daylight[0]} - {cal.daylight[1]}, '
+                        f'{weekend}{", holidays" if cal.holidays else ""}: {", ".join(cities[:3])}{more}\n')
+        tooltip += 'weekends and holidays are rest days\n'
+        if self.skipped:
+            tooltip += f'skipped refreshes {self.skipped}\n'
+        return tooltip
+
+    def json_reload(self, fetch=False):
+        """ Reload dictionary from JSON file in a worker thread, it is swapped in on the main loop.
+        With fetch, the dictionary is refreshed from the API first, like req.py does.
         """
-        self.sunrise_dict = get_dictionary(self.json_file)
-        for k in range(len(self.tzlist)):
-            zone, lat, lon = self.tzlist[k][0], self.tzlist[k][3], self.tzlist[k][4]
-            # get static time-strings calculated from the dictionary
-            self.tzlist[k][5:] = get_sunrize_sunset(self.sunrise_dict, zone, lat, lon)
+        if self.loading:
+            return
+        self.loading = True
+        self.progress = '...'
+        self.update_title()
+        rows = tuple((row.zone, row.lat, row.lon) for row in self.tzlist)
+        threading.Thread(target=self.json_worker, args=(rows, fetch), daemon=True).start()
         return
 
+    def json_worker(self, rows, fetch):
+        # worker thread: build the new sunrise table, do not touch the GUI;
+        # json_swap is posted in any case, or the loading flag would stay set
+        loaded = None
+        try:
+            if fetch:
+                import req
+                req.refresh_json(self.json_file, self.tzlist_file)
+            mtime = os.path.getmtime(self.json_file) if os.path.isfile(self.json_file) else None
+            sunrise_dict = tzrows.get_dictionary(self.json_file)
+            sunrise_index = coord.grid_index(sunrise_dict)
+            table = None
+            if self.grids == 2:
+                table = []
+                for k in range(len(rows)):
+                    table.append(tuple(tzrows.get_sunrize_sunset(sunrise_index, *rows[k])))
+                    if k % 100 == 99:
+                        GLib.idle_add(self.json_progress, k+1, len(rows))
+                table = tuple(table)
+            loaded = (mtime, sunrise_dict, sunrise_index, table)
+        except (OSError, ValueError, ImportError) as e:
+            print(f'{self.json_file}: {e}', file=sys.stderr)
+        finally:
+            if loaded is None:
+                # a broken file is retried only after it changes
+                try:
+                    mtime = os.path.getmtime(self.json_file)
+                except OSError:
+                    mtime = None
+                GLib.idle_add(self.json_swap, None, mtime)
+            else:
+                GLib.idle_add(self.json_swap, loaded)
+        return
+
+    def json_progress(self, done, total):
+        if self.loading:
+            self.progress = f'{100 * done // total}%'
+            self.update_title()
+        return False
+
+    def json_swap(self, loaded, mtime=None):
+        # main loop: swap in the new sunrise table, the dependent columns are recalculated
+        self.loading = False
+        self.progress = ''
+        self.update_title()
+        if loaded is None:
+            self.json_mtime = mtime
+            return False
+        (self.json_mtime, self.sunrise_dict, self.sunrise_index, table) = loaded
+        for k in range(len(self.tzlist)):
+            row = self.tzlist[k]
+            row.invalidate('sunrise')
+            if table:
+                row.sun = table[k]
+        if self.onscreen():
+            self.redraw_gui()
+        else:
+            self.stale = True
+        return False
+
     def redraw_gui(self):
         """ Redraw icons, volatile labels and tooltips.
         """
-        # watch the base offset change (new local_index or DST jump)
-        zone = self.tzlist[self.local_index][0]
-        offset = base_offset( self.utcnow, zone )
-        local_offset = offset
+        # relative offsets to the base row, looked up in the offset matrix
+        local_zone = self.tzlist[self.local_index].zone
 
         for k in range(len(self.tzlist)):
-            (zone, city, country, lat, lon, coords, sunrise, sunset, begin, end, ddump) = self.tzlist[k]
-            (evbox, office_grid, office_iv, office_ls, labels, sunlight_grid, sunlight_iv, sunlight_ls) = self.gui[k]
-
-            dt = pytz.utc.localize( self.utcnow ).astimezone( pytz.timezone(zone) )
-            now = dt.strftime("%H:%M")
-            today = dt.strftime('%m/%d')
+            row = self.tzlist[k]
+            if row.hidden:
+                continue
+            gui = row.gui
+            labels = gui.labels
 
-            offset = base_offset( self.utcnow, zone )
-            phase = 'work' if (coretime[0] <= dt.hour < coretime[1]) else \
-                    'day' if (daylight[0] <= dt.hour < daylight[1]) else \
-                    'rest'
+            dt = row.get('dt')
+            phase = row.get('phase')
 
-            office_ls.clear()
-            if zone == 'UTC':
-                office_ls.append([ self.utc_icon ])
+            gui.office_ls.clear()
+            if row.zone == 'UTC':
+                gui.office_ls.append([ self.utc_icon ])
             elif k == self.home_index:
-                office_ls.append([ self.home_icon ])
+                gui.office_ls.append([ self.home_icon ])
             else:
-                office_ls.append(row=None)
+                gui.office_ls.append(row=None)
 
             if self.grids == 2:
-                sun_times = ''
-                sun_phase = phase
-                tooltip = ''
-
-                sunlight_ls.clear()
-                if not coords:   # not in the dictionary
-                    sunlight_ls.append(row=None)
-                elif re.search(r'not found', ddump):
-                    sunlight_ls.append(row=None)
-                    sun_times = f'no data'
-                    tooltip = f'no data'
+                sun = row.get('sun')   # coords, sunrise, sunset, begin, end, found
+                state = row.get('sun_state')   # sun_times, sun_phase, tooltip
+                sun_phase = state[1]
+
+                gui.sunlight_ls.clear()
+                if not (sun[0] and sun[5]):
+                    gui.sunlight_ls.append(row=None)
+                elif sun_phase == 'sunlight':
+                    gui.sunlight_ls.append([ self.sunlight_icon ])
+                elif sun_phase == 'twilight':
+                    gui.sunlight_ls.append([ self.twilight_icon ])
                 else:
-                    if begin == end:   # no twilight
-                        if (lat[0] != '-') == ("03/20" <= today <= "09/23"):
-                            sun_times = 'Up all day'
-                            sun_phase = 'sunlight'
-                        else:
-                            sun_times = 'Down all day'
-                            sun_phase = 'night'
-                        tooltip = f'{sun_times}, no twilight'
-                    elif sunrise == sunset:   # no sunlight, only twilight
-                        if begin <= now < end:
-                            sun_phase = 'twilight'
-                            tooltip = f'Twilight, dark night at {end}'
-                        else:
-                            sun_phase = 'night'
-                            tooltip = f'Night, dawning at {begin}'
-                        sun_times = f'{begin} ... {end}'
-                    else:
-                        if sunrise <= now < sunset:
-                            sun_phase = 'sunlight'
-                            tooltip = f'Sunlight, sunset at {sunset}'
-                        elif begin <= now < sunset:
-                            sun_phase = 'twilight'
-                            tooltip = f'Twilight, sunrise at {sunrise}'
-                        elif sunset <= now < end:
-                            sun_phase = 'twilight'
-                            tooltip = f'Twilight, dark night at {end}'
-                        else:
-                            sun_phase = 'night'
-                            tooltip = f'Night, dawning at {begin}'
-                        sun_times = f'{begin} {sunrise} {sunset} {end}'
-
-                    if sun_phase == 'sunlight':
-                        sunlight_ls.append([ self.sunlight_icon ])
-                    elif sun_phase == 'twilight':
-                        sunlight_ls.append([ self.twilight_icon ])
-                    else:
-                        sunlight_ls.append([ self.night_icon ])
+                    gui.sunlight_ls.append([ self.night_icon ])
             #---
 
             # background color for the icons and the labels; set color with CSS
-            office_iv.set_name(phase)
-            office_grid.set_name(phase)
+            gui.office_iv.set_name(phase)
+            gui.office_grid.set_name(phase)
             if self.grids == 2:
-                sunlight_iv.set_name(sun_phase)
-                sunlight_grid.set_name(sun_phase)
+                gui.sunlight_iv.set_name(sun_phase)
+                gui.sunlight_grid.set_name(sun_phase)
 
             # labels: foreground color, face, size with pango markup
-            tupdict = hicolors[phase] if (k == self.home_index or k == self.local_index) else fgcolors[phase]
+            tupdict = tzrows.hicolors[phase] if (k == self.home_index or k == self.local_index) else tzrows.fgcolors[phase]
             fmt = [ '<span foreground="%s" face="%s" size="%s">' % (tup) for tup in tupdict ]
-            labels[0].set_markup(fmt[0] + "%s " % city + '</span>')
-            labels[1].set_markup(fmt[0] + "%-15s" % now + '</span>')
-            labels[2].set_markup(fmt[0] + "%-6s" % rel_offset(local_offset, offset) + '</span>')
-            labels[3].set_markup(fmt[1] + "%s " % country + '</span>')
+            labels[0].set_markup(fmt[0] + "%s " % row.city + '</span>')
+            gui.time_fmt = fmt[0] + "%-15s" + '</span>'
+            labels[1].set_markup(gui.time_fmt % row.get('now'))
+            labels[2].set_markup(fmt[0] + "%-6s" % self.offsets.relative(local_zone, row.zone) + '</span>')
+            labels[3].set_markup(fmt[1] + "%s " % row.country + '</span>')
             labels[4].set_markup(fmt[1] + dt.strftime('%a, %Y.%m.%d') + '</span>')
             labels[5].set_markup(fmt[1] + dt.tzname() + '</span>')
+            change = row.get('change')
+            badge = tzrows.change_badge(change, row.zone, self.tzlist[self.local_index].zone)[0] if change else ''
+            labels[8].set_markup(fmt[1] + badge + '</span>')
             if self.grids == 2:
-                if tooltip:
-                    labels[6].set_tooltip_text(tooltip)
-                    labels[7].set_tooltip_text(ddump)
                 reverse = 'rest' if (sun_phase == 'twilight') else 'work'
-                fmt = [ '<span foreground="%s" face="%s" size="%s">' % (tup) for tup in fgcolors[reverse] ]
-                labels[6].set_markup(fmt[0] + "%-25s " % sun_times + '</span>')
-                labels[7].set_markup(fmt[1] + "%-18s" % coords + '</span>')
+                fmt = [ '<span foreground="%s" face="%s" size="%s">' % (tup) for tup in tzrows.fgcolors[reverse] ]
+                labels[6].set_markup(fmt[0] + "%-25s " % state[0] + '</span>')
+                labels[7].set_markup(fmt[1] + "%-18s" % sun[0] + '</span>')
 
         return
 
@@ -427,9 +395,69 @@ class TimesWindow(Gtk.Window):
         utcnow = datetime.datetime.utcnow()
         if utcnow.second == 0 or (self.utcnow.hour != utcnow.hour or self.utcnow.minute != utcnow.minute):
             self.utcnow = utcnow
-            self.redraw_gui()
+            # hidden window, or idle without focus: count the skipped redraw
+            if not self.onscreen() or (idle > 1 and not self.focused and utcnow.minute % idle != 0):
+                self.stale = True
+                self.skipped += 1
+                return True
+            self.update()
+        elif tzrows.seconds and self.onscreen() and not self.stale:
+            self.tick(utcnow)
         return True
 
+    def tick(self, utcnow):
+        # seconds: only the time labels, by the offsets of the minute redraw
+        ts = int((utcnow - tzbundle.EPOCH).total_seconds())
+        for row in self.tzlist:
+            if row.hidden:
+                continue
+            row.gui.labels[1].set_markup(row.gui.time_fmt % tzrows.clock_text(ts, row.get('offset')))
+
+    def update(self):
+        # the dictionary was updated by req.py
+        try:
+            if os.path.getmtime(self.json_file) != self.json_mtime:
+                self.json_reload()
+        except OSError:
+            pass
+        for row in self.tzlist:
+            row.invalidate('time')
+        if self.offsets.update(int((self.utcnow - tzbundle.EPOCH).total_seconds())) and self.by_offset:
+            self.order_rows()
+        self.stale = False
+        self.redraw_gui()
+        if self.skipped != self.tooltip_skipped:
+            self.tooltip_skipped = self.skipped
+            self.set_tooltip_text(self.window_tooltip())
+
+    def order_rows(self):
+        """ Rows in the configured order, or East to West by the current offset.
+        """
+        order = list(range(len(self.tzlist)))
+        if self.by_offset:
+            order.sort(key=lambda k: -self.offsets.minutes[self.tzlist[k].zone])
+        for position, k in enumerate(order):
+            self.vbox.reorder_child(self.tzlist[k].gui.evbox, position)
+
+    def onscreen(self):
+        return self.mapped and not self.iconified and not self.obscured
+
+    def on_visibility(self, widget, event, what):
+        # track the mapped, iconified, fully obscured and focus state
+        if what in ('map', 'unmap'):
+            self.mapped = (what == 'map')
+        elif what == 'state':
+            self.iconified = bool(event.new_window_state & (Gdk.WindowState.ICONIFIED | Gdk.WindowState.WITHDRAWN))
+        elif what == 'notify':
+            self.obscured = (event.state == Gdk.VisibilityState.FULLY_OBSCURED)
+        else:
+            self.focused = (what == 'focus-in')
+        if self.stale and self.onscreen():
+            # catch up with one redraw for the current instant
+            self.utcnow = datetime.datetime.utcnow()
+            self.update()
+        return False
+
     def timerstart(self):
         # interval in miliseconds, the function must return True to continue
         GLib.timeout_add(interval=1000, function=self.refresh)
@@ -441,12 +469,93 @@ class TimesWindow(Gtk.Window):
             self.local_index = gui_index
             self.redraw_gui()
 
+    def on_query_tooltip(self, widget, x, y, keyboard_mode, tooltip, what):
+        # tooltip text from the lazy columns and the distances, nothing to show without data
+        (k, name) = what
+        row = self.tzlist[k]
+        if name == 'change':
+            change = row.get('change')
+            text = tzrows.change_badge(change, row.zone, self.tzlist[self.local_index].zone)[1] if change else ''
+        elif name == 'distance':
+            text = geodist.describe(self.distances, self.local_index, k, self.tzlist[self.local_index].city.strip())
+        elif not row.get('sun')[0]:
+            return False
+        else:
+            text = row.get(name)[2] if name == 'sun_state' else row.get(name)
+        if not text:
+            return False
+        tooltip.set_text(text)
+        return True
+
+    def update_title(self):
+        title = 'TimeZ'
+        if self.progress:
+            title += ' ' + self.progress
+        if self.filtering or self.query:
+            title += ' /' + self.query
+        self.set_title(title)
+
+    def filter_rows(self, query):
+        """ Show only the rows matching all terms of query: city, country or zone
+        by the row index, or UTC offset like +5:30 or utc-3.
+        """
+        narrow = rowindex.narrows(self.query, query)
+        self.query = query
+        visible = set(k for k in range(len(self.tzlist)) if not self.tzlist[k].hidden) if narrow else None
+        terms = []
+        for term in query.lower().split():
+            m = rowindex.OFFSET.match(term)
+            if m:
+                off = m.group(2)
+                strip = '' if off[0] in '+-' else '+-'
+                visible = set(k for k in (visible if visible is not None else range(len(self.tzlist)))
+                              if tzrows.rel_offset(0, self.tzlist[k].get('offset')).lstrip(strip).startswith(off))
+            else:
+                terms.append(term)
+        visible = self.index.search(' '.join(terms), visible)
+
+        for k in range(len(self.tzlist)):
+            row = self.tzlist[k]
+            hidden = k not in visible
+            if hidden != row.hidden:
+                row.hidden = hidden
+                if hidden:
+                    row.gui.evbox.hide()
+                else:
+                    row.gui.evbox.show()
+        self.resize(1, 1)   # shrink to the visible rows
+        self.update_title()
+        self.redraw_gui()
+        return
+
     def keyb_input(self, widget, event, what):
-        if event.keyval == ord('q'):
+        if self.filtering:
+            # type-to-filter: Return keeps the filter, Escape clears it
+            if event.keyval == Gdk.KEY_Escape:
+                self.filtering = False
+                self.filter_rows('')
+            elif event.keyval in (Gdk.KEY_Return, Gdk.KEY_KP_Enter):
+                self.filtering = False
+                self.update_title()
+            elif event.keyval == Gdk.KEY_BackSpace:
+                self.filter_rows(self.query[:-1])
+            else:
+                c = Gdk.keyval_to_unicode(event.keyval)
+                if c >= 32:
+                    self.filter_rows(self.query + chr(c))
+            return True
+        if event.keyval == ord('/'):
+            self.filtering = True
+            self.update_title()
+        elif event.keyval == ord('q'):
             Gtk.main_quit()
+        elif event.keyval == ord('o'):
+            self.by_offset = not self.by_offset
+            self.order_rows()
         elif event.keyval == ord('j'):
             self.json_reload()
-            self.redraw_gui()
+        elif event.keyval == ord('r'):
+            self.json_reload(fetch=True)
 
 def leave(arg0, arg1):
     Gtk.main_quit()
@@ -454,6 +563,8 @@ def leave(arg0, arg1):
 if __name__ == '__main__':
     json_file = JSONFILE
     tzlist_file = TZLIST
+    workdays_file = WORKDAYS
+    by_offset = False
     grids = 1
     i = 1
     while i < len(sys.argv):
@@ -470,11 +581,24 @@ if __name__ == '__main__':
             i += 1
             if os.path.isfile(sys.argv[i]):
                 json_file = sys.argv[i]
+        elif option == "-w" and i+1 < len(sys.argv):
+            i += 1
+            workdays_file = sys.argv[i]
         elif option == "-2.0":
             grids = 2
+        elif option == "-r" and i+1 < len(sys.argv):
+            i += 1
+            tzrows.radar = int(sys.argv[i])
+        elif option == "-s":
+            tzrows.seconds = True
+        elif option == "-o":
+            by_offset = True
+        elif option == "-i" and i+1 < len(sys.argv):
+            i += 1
+            idle = int(sys.argv[i])
         i += 1
 
-    window = TimesWindow(tzlist_file, json_file, grids)
+    window = TimesWindow(tzlist_file, json_file, grids, workdays_file, by_offset)
     window.connect("delete-event", leave)
     window.show_all()
     window.timerstart()
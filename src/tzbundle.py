@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import re
+import time
+import struct
+import tempfile
+import bisect
+import datetime
+from array import array
+import pytz
+
+""" Precompiled transition bundle
+The UTC transition tables of the configured zones are extracted from pytz
+over a horizon of some years, and saved into one binary file.
+The widget loads the bundle with a single read, the offsets and abbreviations
+are resolved with bisect, pytz is the fallback outside the horizon.
+
+File layout (native byte order):
+  header   magic '4s', version 'H'+bytes, since 'q', until 'q', zones 'H'
+  zone     name 'B'+bytes, abbrs 'B' times ('B'+bytes),
+           transitions 'I', times 'q'*n, offsets 'i'*n, abbr index 'B'*n
+"""
+
+MAGIC = b'TZB1'
+TZBUNDLE = os.environ.get('HOME') + '/.config/TimeZ/tz-bundle.bin'
+ZONEINFO = '/usr/share/zoneinfo'
+YEARS = 5   # default horizon, years before and after now
+
+EPOCH = datetime.datetime(1970, 1, 1)
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+
+def tzdata_version():
+    """ Version of the tz database, pytz and system, like '2026e/2025b'.
+    The bundle is invalid if this string changes.
+    """
+    system = ''
+    for fn, pattern in ((ZONEINFO + '/tzdata.zi', r'^# version (\S+)'),
+                        (ZONEINFO + '/+VERSION', r'^(\S+)')):
+        try:
+            with open(fn, 'r') as f:
+                m = re.match(pattern, f.readline())
+        except OSError:
+            continue
+        if m:
+            system = m.group(1)
+            break
+    return f'{pytz.OLSON_VERSION}/{system}'
+
+
+def zone_table(zone, since, until):
+    """ Extract the transition table of zone between since and until (UTC seconds).
+    Return three lists: start times, offsets in seconds, abbreviations.
+    The first start time is since, the state at that moment.
+    """
+    tz = pytz.timezone(zone)
+    if not hasattr(tz, '_utc_transition_times'):
+        # UTC or StaticTzInfo
+        return [since], [int(tz.utcoffset(None).total_seconds())], [tz.tzname(None)]
+
+    times, offsets, abbrs = [], [], []
+    for utc, (off, dst, abbr) in zip(tz._utc_transition_times, tz._transition_info):
+        ts = int((utc - EPOCH).total_seconds()) if utc.year > 1 else since
+        if ts >= until:
+            break
+        if ts <= since:
+            # the state at since, replaces the older ones
+            times, offsets, abbrs = [since], [int(off.total_seconds())], [abbr]
+        else:
+            times.append(ts)
+            offsets.append(int(off.total_seconds()))
+            abbrs.append(abbr)
+    return times, offsets, abbrs
+
+
+def build_bundle(zones, fname=TZBUNDLE, years=YEARS):
+    """ Save the transition tables of zones into the bundle file.
+    Unknown zones are skipped. Return the number of zones saved.
+    """
+    now = int(time.time())
+    since, until = now - years * SECONDS_PER_YEAR, now + years * SECONDS_PER_YEAR
+    version = tzdata_version().encode()
+
+    body = []
+    count = 0
+    for zone in sorted(set(zones)):
+        if zone not in pytz.all_timezones_set:
+            continue
+        times, offsets, abbrs = zone_table(zone, since, until)
+        names = sorted(set(abbrs))
+        body.append(struct.pack('<B', len(zone)) + zone.encode())
+        body.append(struct.pack('<B', len(names)))
+        for name in names:
+            body.append(struct.pack('<B', len(name)) + name.encode())
+        body.append(struct.pack('<I', len(times)))
+        body.append(array('q', times).tobytes())
+        body.append(array('i', offsets).tobytes())
+        body.append(bytes(names.index(abbr) for abbr in abbrs))
+        count += 1
+
+    dname = os.path.dirname(fname)
+    if dname and not os.path.isdir(dname):
+        os.makedirs(dname)
+    header = MAGIC + struct.pack('<H', len(version)) + version + struct.pack('<qqH', since, until, count)
+    # unique temporary file, the builders may run concurrently
+    fd, tmp = tempfile.mkstemp(dir=dname or '.', prefix=os.path.basename(fname) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header + b''.join(body))
+        os.replace(tmp, fname)
+    except OSError:
+        os.unlink(tmp)
+        raise
+    return count
+
+
+class BundleTz(datetime.tzinfo):
+    """ tzinfo of one zone from the bundle, for astimezone() only.
+    The converted datetime gets a fixed offset tzinfo with the abbreviation,
+    so utcoffset() and tzname() of the result are plain attribute reads.
+    """
+
+    def __init__(self, bundle, zone):
+        self.bundle = bundle
+        self.zone = zone
+
+    def fromutc(self, dt):
+        utc = dt.replace(tzinfo=None)
+        ts = int((utc - EPOCH).total_seconds())
+        fixed = self.bundle.fixed(self.zone, ts)
+        if fixed is None:
+            return pytz.utc.localize(utc).astimezone(pytz.timezone(self.zone))
+        return (utc + fixed.utcoffset(None)).replace(tzinfo=fixed)
+
+    def _local(self, dt):
+        # wall time of this zone to (offset, abbreviation), pytz is the fallback
+        local = dt.replace(tzinfo=None)
+        ts = int((local - EPOCH).total_seconds())
+        fixed = self.bundle.fixed(self.zone, ts)
+        if fixed is not None:
+            fixed = self.bundle.fixed(self.zone, ts - int(fixed.utcoffset(None).total_seconds()))
+        if fixed is not None:
+            return fixed.utcoffset(None), fixed.tzname(None)
+        local = pytz.timezone(self.zone).localize(local)
+        return local.utcoffset(), local.tzname()
+
+    def utcoffset(self, dt):
+        return None if dt is None else self._local(dt)[0]
+
+    def tzname(self, dt):
+        return self.zone if dt is None else self._local(dt)[1]
+
+    def dst(self, dt):
+        return None
+
+    def __repr__(self):
+        return f'<BundleTz {self.zone}>'
+
+
+class TzBundle:
+    """ Transition tables loaded from the bundle file.
+    zones: zone -> (times, offsets, abbr index, abbrs)
+    """
+
+    def __init__(self, fname=None):
+        self.version = ''
+        self.since, self.until = 0, 0
+        self.zones = {}
+        self._tz = {}
+        self._fixed = {}
+        if fname:
+            self.load(fname)
+
+    def load(self, fname):
+        with open(fname, 'rb') as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f'{fname}: not a tz bundle')
+        pos = 4
+        (vlen,) = struct.unpack_from('<H', data, pos)
+        pos += 2
+        self.version = data[pos:pos+vlen].decode()
+        pos += vlen
+        self.since, self.until, count = struct.unpack_from('<qqH', data, pos)
+        pos += struct.calcsize('<qqH')
+        try:
+            for _ in range(count):
+                zone, pos = self._string(data, pos)
+                names = []
+                nabbr, pos = data[pos], pos+1
+                for _ in range(nabbr):
+                    name, pos = self._string(data, pos)
+                    names.append(name)
+                (n,) = struct.unpack_from('<I', data, pos)
+                pos += 4
+                if pos + 13*n > len(data):
+                    raise IndexError
+                times = array('q', data[pos:pos+8*n])
+                pos += 8*n
+                offsets = array('i', data[pos:pos+4*n])
+                pos += 4*n
+                index = data[pos:pos+n]
+                pos += n
+                self.zones[zone] = (times, offsets, index, names)
+        except (IndexError, struct.error):
+            self.zones = {}
+            raise ValueError(f'{fname}: truncated tz bundle')
+        return self
+
+    @staticmethod
+    def _string(data, pos):
+        n = data[pos]
+        return data[pos+1:pos+1+n].decode(), pos+1+n
+
+    def valid(self, zones=()):
+        """ The bundle is up-to-date and covers the known zones.
+        """
+        now = time.time()
+        if self.version != tzdata_version() or not (self.since <= now < self.until):
+            return False
+        return all(zone in self.zones for zone in zones if zone in pytz.all_timezones_set)
+
+    def offset(self, zone, ts):
+        """ Return (offset in seconds, abbreviation) of zone at UTC seconds ts,
+        or None if zone is not in the bundle or ts is out of the horizon.
+        """
+        if zone not in self.zones or not (self.since <= ts < self.until):
+            return None
+        times, offsets, index, names = self.zones[zone]
+        i = bisect.bisect_right(times, ts) - 1
+        return offsets[i], names[index[i]]
+
+    def fixed(self, zone, ts):
+        """ Fixed offset tzinfo of zone at UTC seconds ts, or None.
+        """
+        ans = self.offset(zone, ts)
+        if ans is None:
+            return None
+        if ans not in self._fixed:
+            self._fixed[ans] = datetime.timezone(datetime.timedelta(seconds=ans[0]), ans[1])
+        return self._fixed[ans]
+
+    def transitions(self, zone):
+        """ Return (times, offsets) of zone, sorted by time, or None.
+        """
+        if zone not in self.zones:
+            return None
+        return self.zones[zone][:2]
+
+    def timezone(self, zone):
+        """ Like pytz.timezone() but resolved from the bundle if possible.
+        Raise pytz.UnknownTimeZoneError for unknown zones.
+        """
+        if zone not in self._tz:
+            self._tz[zone] = BundleTz(self, zone) if zone in self.zones else pytz.timezone(zone)
+        return self._tz[zone]
+
+
+def read_tzlist(tzlist_file):
+    """ (zone, city, country) items of the configuration file, without validation.
+    """
+    sites = []
+    with open(tzlist_file, 'r') as f:
+        for raw in f:
+            line = raw.strip()
+            if len(line) == 0 or re.match(r'^[ \t]*#|[ \t]*$', line):
+                continue
+            items = re.split('\t+', line.replace('"', ''))
+            if len(items) >= 3:
+                sites.append((items[0], items[1], items[2]))
+    return sites
+
+
+bundle = TzBundle()
+
+def use_bundle(zones, fname=TZBUNDLE, years=YEARS):
+    """ Load the bundle file for the module level timezone(), rebuild if invalid.
+    The zones of the bundle are kept, the missing zones are added.
+    """
+    global bundle
+    known = set()
+    try:
+        bundle = TzBundle(fname)
+        if bundle.valid(zones):
+            return bundle
+        known = set(bundle.zones)
+    except (OSError, ValueError, struct.error):
+        pass
+    try:
+        build_bundle(known.union(zones), fname, years)
+        bundle = TzBundle(fname)
+    except OSError as e:
+        print(f'{fname}: {e.strerror}, bundle not used', file=sys.stderr)
+        bundle = TzBundle()
+    return bundle
+
+def timezone(zone):
+    return bundle.timezone(zone)
+
+def offset_at(zone, ts):
+    """ UTC offset of zone in seconds at UTC seconds ts.
+    """
+    ans = bundle.offset(zone, ts)
+    if ans is None:
+        dt = pytz.utc.localize(EPOCH + datetime.timedelta(seconds=ts)).astimezone(pytz.timezone(zone))
+        return int(dt.utcoffset().total_seconds())
+    return ans[0]
+
+def offset_changes(zone, since, until):
+    """ UTC offset changes of zone in (since, until), sorted.
+    Return list of (ts, old offset, new offset), offsets in seconds.
+    Changes of the abbreviation only are not listed.
+    """
+    table = bundle.transitions(zone)
+    if table is None or not (bundle.since <= since and until <= bundle.until):
+        table = zone_table(zone, since, until)[:2]
+    times, offsets = table
+    i = max(0, bisect.bisect_right(times, since) - 1)
+    prev = offsets[i]
+    changes = []
+    for j in range(i+1, bisect.bisect_left(times, until)):
+        if offsets[j] != prev:
+            changes.append((times[j], prev, offsets[j]))
+            prev = offsets[j]
+    return changes
+
+
+if __name__ == '__main__':
+    bundle_file = TZBUNDLE
+    import tzrows
+    tzlist_file = tzrows.TZLIST
+    years = YEARS
+
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 tzbundle.py [-t tzlist_file] [-b bundle_file] [-y years]
+    options:
+        -y  horizon in years before and after now, default {YEARS}
+""", file=sys.stderr)
+            quit()
+        elif option == "-t" and i+1 < len(sys.argv):
+            i += 1
+            if os.path.isfile(sys.argv[i]):
+                tzlist_file = sys.argv[i]
+        elif option == "-b" and i+1 < len(sys.argv):
+            i += 1
+            bundle_file = sys.argv[i]
+        elif option == "-y" and i+1 < len(sys.argv):
+            i += 1
+            years = int(sys.argv[i])
+        i += 1
+
+    zones = [site[0] for site in read_tzlist(tzlist_file)]
+    count = build_bundle(zones, bundle_file, years)
+    print(f"{count} zones saved, {tzdata_version()}, {bundle_file}")
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import re
+import math
+import json
+import bisect
+import datetime
+import itertools
+import pytz
+import tzbundle
+import workcal
+import tzrows
+
+""" Bulk timestamp converter
+Read lines starting with a UTC timestamp (epoch seconds or ISO 8601),
+annotate each line with the local time, offset and office phase of the sites.
+The lines are converted in chunks, zone by zone, against the transition
+tables of the bundle; the offset is reused while the timestamps stay in
+the same transition interval, the dates are cached per day. The office
+phase comes from the working calendar of the site, see workcal.py.
+"""
+
+CHUNK = 65536   # lines per chunk
+
+# epoch seconds of the datetime range, a day inside for the local time
+EPOCH_RANGE = (int((datetime.datetime(1, 1, 2) - tzbundle.EPOCH).total_seconds()),
+               int((datetime.datetime(9999, 12, 31) - tzbundle.EPOCH).total_seconds()))
+
+# the leading timestamp of the line: ISO 8601 date and time, or epoch seconds
+TIMESTAMP = re.compile(r'^\s*(\d{4}-\d\d-\d\d[T ]\d\d:\d\d(?::\d\d(?:[.,]\d+)?)?(?:Z|[+-]\d\d:?\d\d)?'
+                       r'|[-+]?\d+(?:\.\d+)?)(?=\s|$)')
+
+
+def parse_timestamp(line):
+    """ Epoch seconds (int) of the leading timestamp of line, or None.
+    ISO timestamps without offset are UTC. None also out of the years 1..9999,
+    like milliseconds since the epoch.
+    """
+    m = TIMESTAMP.match(line)
+    if not m:
+        return None
+    field = m.group(1)
+    try:
+        if ':' not in field:
+            ts = math.floor(float(field))
+        else:
+            dt = datetime.datetime.fromisoformat(field.replace(',', '.').replace('Z', '+00:00'))
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(pytz.utc).replace(tzinfo=None)
+            ts = math.floor((dt - tzbundle.EPOCH).total_seconds())
+    except (ValueError, OverflowError):
+        return None
+    if not EPOCH_RANGE[0] <= ts <= EPOCH_RANGE[1]:
+        return None
+    return ts
+
+
+class Cursor:
+    """ Offset of one zone for the timestamps, bisect only if the
+    timestamp leaves the current transition interval [lo, hi).
+    """
+    __slots__ = ('zone', 'times', 'offsets', 'until', 'lo', 'hi', 'off')
+
+    def __init__(self, zone):
+        self.zone = zone
+        table = tzbundle.bundle.transitions(zone)
+        self.times, self.offsets = table if table else ((), ())
+        self.until = tzbundle.bundle.until
+        self.lo, self.hi, self.off = 1, 0, 0
+
+    def offset(self, ts):
+        if self.lo <= ts < self.hi:
+            return self.off
+        times = self.times
+        if times and times[0] <= ts < self.until:
+            i = bisect.bisect_right(times, ts) - 1
+            self.lo = times[i]
+            self.hi = times[i+1] if i+1 < len(times) else self.until
+            self.off = self.offsets[i]
+            return self.off
+        # outside of the bundle horizon
+        dt = pytz.utc.localize(tzbundle.EPOCH + datetime.timedelta(seconds=ts)).astimezone(pytz.timezone(self.zone))
+        return int(dt.utcoffset().total_seconds())
+
+
+class Annotator:
+    """ Local time, offset and phase strings with integer arithmetic,
+    the phase is a bit test in the calendar of the site.
+    """
+
+    def __init__(self):
+        self.dates = {}   # epoch day -> (date string, year, day of the year from 0)
+        self.offsets = {}
+
+    def offset_text(self, off):
+        if off not in self.offsets:
+            s, m = ('-', -off) if off < 0 else ('+', off)
+            self.offsets[off] = '%s%02d:%02d' % (s, m // 3600, m % 3600 // 60)
+        return self.offsets[off]
+
+    def column(self, epochs, cursor, calendar=workcal.default):
+        """ Annotate a chunk of epochs for one site: list of (local, offset, phase) or None.
+        """
+        dates = self.dates
+        offset = cursor.offset
+        phase = calendar.hour_phase
+        column = []
+        append = column.append
+        for ts in epochs:
+            if ts is None:
+                append(None)
+                continue
+            off = offset(ts)
+            days, sec = divmod(ts + off, 86400)
+            date = dates.get(days)
+            if date is None:
+                day = tzbundle.EPOCH + datetime.timedelta(days=days)
+                date = dates[days] = (day.strftime('%Y-%m-%d'), day.year, day.timetuple().tm_yday - 1)
+            hh, sec = divmod(sec, 3600)
+            append(('%s %02d:%02d:%02d' % (date[0], hh, sec // 60, sec % 60), self.offset_text(off),
+                    phase(date[1], date[2], hh)))
+        return column
+
+
+def convert(lines, sites, fmt='tsv', chunk=CHUNK, stats=None, annotator=None, calendars=None):
+    """ Generator of the annotated lines, TAB separated or JSON lines.
+    sites: list of (zone, city, country). calendars: dict of workcal.read_workdays(), or None.
+    stats: optional dict, counts 'lines' and 'bad'.
+    """
+    annotator = annotator or Annotator()
+    tzbundle.use_bundle([site[0] for site in sites])
+    cursors = [Cursor(site[0]) for site in sites]
+    cals = [workcal.site_calendar(calendars or {}, *site[:3]) for site in sites]
+    cities = [site[1].strip() for site in sites]
+    stats = stats if stats is not None else {}
+    stats.setdefault('lines', 0)
+    stats.setdefault('bad', 0)
+
+    it = iter(lines)
+    while True:
+        block = [line.rstrip('\n') for line in itertools.islice(it, chunk)]
+        if not block:
+            break
+        epochs = [parse_timestamp(line) for line in block]
+        columns = [annotator.column(epochs, cursor, cal) for cursor, cal in zip(cursors, cals)]
+        stats['lines'] += len(block)
+        stats['bad'] += epochs.count(None)
+
+        for k in range(len(block)):
+            if fmt == 'json':
+                sites_k = {}
+                for city, column in zip(cities, columns):
+                    if column[k]:
+                        sites_k[city] = {'local': column[k][0], 'offset': column[k][1], 'phase': column[k][2]}
+                yield json.dumps({'utc': epochs[k], 'line': block[k], 'sites': sites_k})
+            else:
+                yield block[k] + ''.join(('\t' + '\t'.join(column[k]) if column[k] else '\t\t\t')
+                                         for column in columns)
+
+
+def header(sites):
+    """ TSV header for convert().
+    """
+    return '#line' + ''.join(f'\t{c}.local\t{c}.offset\t{c}.phase'
+                             for c in (site[1].strip() for site in sites))
+
+
+if __name__ == '__main__':
+    tzlist_file = tzrows.TZLIST
+    fname = '-'
+    fmt = 'tsv'
+    subset = None
+    workdays_file = workcal.WORKDAYS
+
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 tzconvert.py [-t tzlist_file] [-s zone_or_city,...] [-w workdays_file] [--json] [file]
+    annotate lines starting with a UTC timestamp, read from file or stdin
+    options:
+        -s  only these sites, zones or cities, comma separated
+        -w  working calendars of the office phase, default {workcal.WORKDAYS}
+        --json  JSON lines instead of TAB separated output
+""", file=sys.stderr)
+            quit()
+        elif option == "-t" and i+1 < len(sys.argv):
+            i += 1
+            if os.path.isfile(sys.argv[i]):
+                tzlist_file = sys.argv[i]
+        elif option == "-s" and i+1 < len(sys.argv):
+            i += 1
+            subset = set(sys.argv[i].split(','))
+        elif option == "-w" and i+1 < len(sys.argv):
+            i += 1
+            workdays_file = sys.argv[i]
+        elif option == "--json":
+            fmt = 'json'
+        else:
+            fname = option
+        i += 1
+
+    sites = tzbundle.read_tzlist(tzlist_file)
+    if subset:
+        sites = [site for site in sites if site[0] in subset or site[1].strip() in subset]
+    sites = [site for site in sites if site[0] in pytz.all_timezones_set]
+    if not sites:
+        print(f'no sites from {tzlist_file}', file=sys.stderr)
+        quit()
+
+    stats = {}
+    f = sys.stdin if fname == '-' else open(fname, 'r')
+    out = sys.stdout
+    if fmt == 'tsv':
+        out.write(header(sites) + '\n')
+    lines = convert(f, sites, fmt, stats=stats, calendars=workcal.read_workdays(workdays_file))
+    try:
+        while True:
+            block = list(itertools.islice(lines, CHUNK))
+            if not block:
+                break
+            out.write('\n'.join(block) + '\n')
+    except BrokenPipeError:
+        pass
+    print(f"{stats['lines']} lines, {stats['bad']} without timestamp", file=sys.stderr)
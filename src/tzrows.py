@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import datetime
+import pytz
+import re
+import json
+import tzbundle
+import coord
+import workcal
+
+""" The rows of the TimeZ board without the GUI: the configuration, the sunrise
+dictionary, the lazy columns of the rows, the offsets and the colors by phase.
+Used by timez2.py and kiosk.py, this module does not import Gtk.
+"""
+
+TZLIST = os.environ.get('HOME') + '/.timez'
+# see /usr/share/zoneinfo or pytz.all_timezones
+radar = 14   # days, badge for the upcoming UTC offset changes
+seconds = False   # HH:MM:SS, only the time labels are updated in every second
+JSONFILE = os.environ.get('HOME') + '/.config/TimeZ/sunrise-sunset.json'
+TZBUNDLE = tzbundle.TZBUNDLE   # transition tables of the configured zones
+WORKDAYS = workcal.WORKDAYS   # office hours, weekends and holidays by city, zone or country
+
+# bg colors by phase -- use CSS
+css = b'''
+    #work { background: grey97; }
+    #day { background: grey75; }
+    #rest { background: grey42; }
+    #sunlight { background: #B1DAE7; }
+    #twilight { background: #63B4CF; }
+    #night { background: #316577; }
+'''
+
+# (foreground, face, size) font attributes for the 1st and 2nd line, normal labels
+fgcolors = {'work': (('grey17', 'monospace', 'medium'), ('grey53', 'sans', 'small')),
+            'day':  (('grey11', 'monospace', 'medium'), ('grey42', 'sans', 'small')),
+            'rest': (('grey5', 'monospace', 'medium'),  ('grey23', 'sans', 'small'))}
+hicolors = {'work': (('navy blue', 'monospace', 'medium'), ('medium blue', 'sans', 'small')),
+            'day':  (('navy blue', 'monospace', 'medium'), ('medium blue', 'sans', 'small')),
+            'rest': (('navy blue', 'monospace', 'medium'), ('navy blue',   'sans', 'small'))}
+def something_like_usage(reason, fn=None):
+    if reason == 'enoent' or reason == 'empty':
+        if reason == 'enoent':
+            print(f'Configuration file [{fn}] does not exist', file=sys.stderr)
+        elif reason == 'empty':
+            print(f'Configuration file [{fn}] has no configuration', file=sys.stderr)
+        print("""
+>>> This file should contain something like this:
+# lines in this file must have TAB separated fields,
+# and at least 3 items: Zone City Country (optional coordinates: Lat Lon, like 47.49 or 47°29′N)
+Pacific/Auckland	Auckland	New Zealand	-36.84	174.76
+Europe/Budapest		Budapest	Hungary		47.49	19.04
+America/Halifax		Halifax		Canada		44.65	-63.58
+>>> Cities can be looked up offline: python3 gazetteer.py Halifax >> ~/.timez
+>>> Have fun!
+""", file=sys.stderr)
+    quit()
+
+def get_tzlist(tzlist_file, home_zone):
+    """ Parse the configuration file.
+    Must be TAB separated items: zone, city, country, lat, lon
+    The coordinates may also be one field with the pair, like 47°29′N / 19°02′E.
+    The coordinates may be DD, DDM or DMS, converted to decimal strings.
+    Skip empty and comment lines. Double quotes will be removed, TABs squeezed.
+    The zones are resolved from the transition bundle, rebuilt if necessary.
+    Return the configuration list and the index of first item with home_zone.
+    """
+    if not os.path.isfile(tzlist_file):
+        something_like_usage('enoent', tzlist_file)
+
+    rows = []
+    with open(tzlist_file, 'r') as f:
+        for raw in f:
+            line = raw.strip()
+            if len(line) == 0 or re.match(r'^[ \t]*#|[ \t]*$', line):
+                continue
+            line = line.replace('"', '')
+            items = re.split('\t+', line)
+            if len(items) >= 4:
+                (zone, city, country) = items[:3]
+                try:
+                    lat, lon = coord.site_coords(items[3:5])
+                except ValueError as e:
+                    print(f'Error: {city} coordinates ignored, {e}', file=sys.stderr)
+                    lat, lon = None, None
+            elif len(items) >= 3:
+                (zone, city, country) = items[:3]
+                lat, lon = None, None
+            else:
+                continue
+            rows.append([zone, city, country, lat, lon])
+
+    tzbundle.use_bundle([row[0] for row in rows], TZBUNDLE)
+    tzlist = []
+    utcnow = datetime.datetime.utcnow()
+    home_index = -1
+    for row in rows:
+        zone = row[0]
+        try:
+            offset = base_offset(utcnow, zone)
+        except pytz.UnknownTimeZoneError:
+            print(f'Error: {zone} ignored', file=sys.stderr)
+            continue
+        tzlist.append(row)
+        if home_index == -1 and zone == home_zone:
+            home_index = len(tzlist)-1
+
+    if len(tzlist) == 0:
+        something_like_usage('empty', tzlist_file)
+    clen = max(14, max(( len(item[1]) for item in tzlist )))
+    for item in tzlist:
+        item[1] = (item[1]+" "*clen)[:clen]
+
+    return (tzlist, home_index)
+
+def get_dictionary(json_file):
+    """ Load the dictionary from JSON file.
+    """
+    if os.path.isfile(json_file):
+        with open(json_file, 'r') as f:
+            sunrise_dict = json.load(f)
+    else:
+        sunrise_dict = {}
+    return sunrise_dict
+
+def get_sunrise_entry(sunrise_index, lat, lon):
+    """ Entry of the sunrise dictionary for (lat, lon) from the grid index, or None.
+    """
+    if lat is None or lon is None:
+        return None
+    return coord.grid_lookup(sunrise_index, lat, lon)
+
+def get_sunrize_sunset(sunrise_index, zone, lat, lon):
+    """ Calculate static "%H:%M" values for (lat, lon) based on the information in sunrise dictionary.
+    The last item is True if (lat, lon) is in the dictionary.
+    """
+    cs = f'({lat:.2f}, {lon:.2f})' if (lat is not None and lon is not None) else ''
+    r, s, b, e = '', '', '', ''
+
+    entry = get_sunrise_entry(sunrise_index, lat, lon)
+    if entry:
+        ans = entry['result']
+
+        dlen = ans['day_length']
+        if dlen > 0:
+            sunrise = datetime.datetime.fromisoformat( ans['sunrise'] )
+            sunset = datetime.datetime.fromisoformat( ans['sunset'] )
+            r = sunrise.astimezone( tzbundle.timezone(zone) ).strftime("%H:%M")
+            s = sunset.astimezone( tzbundle.timezone(zone) ).strftime("%H:%M")
+
+        beg = datetime.datetime.fromisoformat( ans['civil_twilight_begin'] )
+        end = datetime.datetime.fromisoformat( ans['civil_twilight_end'] )
+        tlen = int((end - beg).total_seconds())
+        if tlen > 0:
+            b = beg.astimezone( tzbundle.timezone(zone) ).strftime("%H:%M")
+            e = end.astimezone( tzbundle.timezone(zone) ).strftime("%H:%M")
+
+    return [cs, r, s, b, e, entry is not None]
+
+def get_sunrise_text(sunrise_index, lat, lon):
+    """ Dump the sunrise dictionary entry of (lat, lon) for the tooltip.
+    """
+    entry = get_sunrise_entry(sunrise_index, lat, lon)
+    if entry:
+        ans = entry['result']
+        return f'Lat {lat} Long {lon}\n' + '\n'.join((f'  {k} {v}' for k, v in ans.items()))
+    return f'Lat {lat} Long {lon}\n' + '  not found'
+
+def get_sun_state(sun, now, today, lat, phase):
+    """ Sunlight phase at local time now ("%H:%M") from the static sun values.
+    Return (sun_times, sun_phase, tooltip).
+    """
+    (coords, sunrise, sunset, begin, end, found) = sun
+    sun_times = ''
+    sun_phase = phase
+    tooltip = ''
+
+    if not coords:   # not in the dictionary
+        pass
+    elif not found:
+        sun_times = f'no data'
+        tooltip = f'no data'
+    elif begin == end:   # no twilight
+        if (lat >= 0) == ("03/20" <= today <= "09/23"):
+            sun_times = 'Up all day'
+            sun_phase = 'sunlight'
+        else:
+            sun_times = 'Down all day'
+            sun_phase = 'night'
+        tooltip = f'{sun_times}, no twilight'
+    elif sunrise == sunset:   # no sunlight, only twilight
+        if begin <= now < end:
+            sun_phase = 'twilight'
+            tooltip = f'Twilight, dark night at {end}'
+        else:
+            sun_phase = 'night'
+            tooltip = f'Night, dawning at {begin}'
+        sun_times = f'{begin} ... {end}'
+    else:
+        if sunrise <= now < sunset:
+            sun_phase = 'sunlight'
+            tooltip = f'Sunlight, sunset at {sunset}'
+        elif begin <= now < sunset:
+            sun_phase = 'twilight'
+            tooltip = f'Twilight, sunrise at {sunrise}'
+        elif sunset <= now < end:
+            sun_phase = 'twilight'
+            tooltip = f'Twilight, dark night at {end}'
+        else:
+            sun_phase = 'night'
+            tooltip = f'Night, dawning at {begin}'
+        sun_times = f'{begin} {sunrise} {sunset} {end}'
+
+    return (sun_times, sun_phase, tooltip)
+
+def base_offset(utcnow, zone):
+    """ Calculate the actual offset in minutes from UTC.
+    """
+    dt = pytz.utc.localize( utcnow ).astimezone( tzbundle.timezone(zone) )
+    return dt.utcoffset().days * 24*60 + dt.utcoffset().seconds // 60
+
+def next_change(utcnow, zone):
+    """ The next UTC offset change of zone within the radar days: (ts, old, new) or ().
+    """
+    ts = int((utcnow - tzbundle.EPOCH).total_seconds())
+    changes = tzbundle.offset_changes(zone, ts, ts + radar * 86400)
+    return changes[0] if changes else ()
+
+def change_badge(change, zone, local_zone):
+    """ Badge text and tooltip of the offset change, with the relative offset shift to local_zone.
+    """
+    ts, old, new = change
+    before = tzbundle.offset_at(local_zone, ts - 1) // 60
+    after = tzbundle.offset_at(local_zone, ts) // 60
+    local = tzbundle.EPOCH + datetime.timedelta(seconds=ts + new)
+    when = local.strftime('%a %d %b %H:%M')
+    shift = f'{rel_offset(before, old // 60)} > {rel_offset(after, new // 60)}'
+    text = f"{local.strftime('%d %b')} {shift}"
+    tooltip = (f'{zone} changes UTC offset at {when} local time\n'
+               f'  {rel_offset(0, old // 60)} > {rel_offset(0, new // 60)} from UTC\n'
+               f'  {shift} relative to {local_zone}')
+    return (text, tooltip)
+
+def clock_text(ts, offset):
+    """ HH:MM:SS of the epoch seconds ts at offset minutes, integer arithmetic only.
+    """
+    sec = (ts + offset * 60) % 86400
+    return '%02d:%02d:%02d' % (sec // 3600, sec // 60 % 60, sec % 60)
+
+def rel_offset(baseoff, target):
+    """ Calculate the relative offset and return formatted string.
+    """
+    off = target - baseoff
+    if off == 0:
+        s = '0'
+    elif off % 60 == 0:
+        s = '%+d' % (off//60)
+    elif off < 0:
+        off = -off
+        s = '-%d:%02d' % (off//60, off%60)
+    else:
+        s = '+%d:%02d' % (off//60, off%60)
+    return s
+
+class OffsetMatrix:
+    """ UTC offsets of the zones in minutes, and the relative offset texts of all pairs
+    of the distinct offsets. Recomputed only when the time leaves the interval
+    without offset change of the zones, the base row change is a lookup.
+    """
+
+    def __init__(self, zones):
+        self.zones = tuple(dict.fromkeys(zones))
+        self.lo = self.hi = 0   # no offset change in [lo, hi)
+        self.minutes = {}   # zone -> offset
+        self.index = {}   # zone -> index of the distinct offset
+        self.texts = []   # texts[base][k], relative offsets of the distinct offsets
+
+    def update(self, ts):
+        """ Recompute at epoch seconds ts if needed, return True if recomputed.
+        """
+        if self.lo <= ts < self.hi:
+            return False
+        self.lo, self.hi = ts, ts + 86400
+        for zone in self.zones:
+            self.minutes[zone] = tzbundle.offset_at(zone, ts) // 60
+            changes = tzbundle.offset_changes(zone, ts, self.hi)
+            if changes:
+                self.hi = min(self.hi, changes[0][0])
+        distinct = sorted(set(self.minutes.values()))
+        self.index = {zone: distinct.index(off) for zone, off in self.minutes.items()}
+        self.texts = [[rel_offset(base, off) for off in distinct] for base in distinct]
+        return True
+
+    def relative(self, base_zone, zone):
+        return self.texts[self.index[base_zone]][self.index[zone]]
+
+# lazy columns of a row: name -> (function of the row, sources of invalidation)
+# source 'time' is the clock tick, 'sunrise' is the sunrise dictionary
+columns = {
+    'dt':       (lambda row: pytz.utc.localize( row.owner.utcnow ).astimezone( tzbundle.timezone(row.zone) ), ('time',)),
+    'now':      (lambda row: row.get('dt').strftime("%H:%M:%S" if seconds else "%H:%M"), ('time',)),
+    'offset':   (lambda row: row.owner.offsets.minutes[row.zone], ('time',)),
+    'change':   (lambda row: next_change( row.owner.utcnow, row.zone ), ('time',)),
+    'phase':    (lambda row: row.calendar.phase(row.get('dt')), ('time',)),
+    'sun':      (lambda row: get_sunrize_sunset(row.owner.sunrise_index, row.zone, row.lat, row.lon), ('sunrise',)),
+    'sun_state': (lambda row: get_sun_state(row.get('sun'), row.get('now'), row.get('dt').strftime('%m/%d'),
+                                            row.lat, row.get('phase')), ('time', 'sunrise')),
+    'ddump':    (lambda row: get_sunrise_text(row.owner.sunrise_index, row.lat, row.lon), ('sunrise',)),
+}
+
+# column names by source, for the invalidation
+sources = {src: [name for name in columns if src in columns[name][1]] for src in ('time', 'sunrise')}
+
+class Row:
+    """ One configured location, the derived columns are computed on first use
+    and dropped by invalidate() when their source changes.
+    Zone and country are interned, coordinates are floats (or None).
+    The working calendar gives the office phase, weekends and holidays are rest.
+    """
+    __slots__ = ('owner', 'zone', 'city', 'country', 'lat', 'lon', 'calendar', 'gui', 'hidden') + tuple(columns)
+
+    def __init__(self, owner, zone, city, country, lat, lon):
+        self.owner = owner
+        self.zone = sys.intern(zone)
+        self.city = city
+        self.country = sys.intern(country)
+        self.lat = float(lat) if lat else None
+        self.lon = float(lon) if lon else None
+        self.calendar = workcal.default
+        self.gui = None
+        self.hidden = False
+        for name in columns:
+            setattr(self, name, None)
+
+    def get(self, name):
+        value = getattr(self, name)
+        if value is None:
+            value = columns[name][0](self)
+            setattr(self, name, value)
+        return value
+
+    def invalidate(self, *srcs):
+        for src in srcs:
+            for name in sources[src]:
+                setattr(self, name, None)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import re
+import time
+import datetime
+import pytz
+import tzbundle
+
+""" Working calendars of the sites
+The office hours, weekend days and holidays of a site are compiled into
+bitsets, one bit per local hour of the year, so the office phase of
+an instant is a bit test. The calendars are read from a TAB separated file:
+    key   core_hours   weekend_days   [holiday_file]
+where key is a city, zone or country of the configuration (the first
+match wins in this order), like
+    Israel      8-17    Fri,Sat     ~/.config/TimeZ/holidays-il.txt
+The holiday file has YYYY-MM-DD dates, or MM-DD for every year,
+optionally followed by the name of the holiday.
+"""
+
+WORKDAYS = os.environ.get('HOME') + '/.config/TimeZ/workdays.tsv'
+coretime = (9, 17)   # office core time; [from, before), as in timez2.py
+daylight = (7, 19)   # potential work hours, the rest is night
+weekend = (5, 6)   # Saturday, Sunday; datetime.weekday()
+
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def read_holidays(fname):
+    """ Holidays of the file: set of (year, month, day), year 0 for every year.
+    """
+    holidays = set()
+    with open(os.path.expanduser(fname), 'r') as f:
+        for line in f:
+            m = re.match(r'^\s*(?:(\d{4})-)?(\d\d)-(\d\d)\b', line)
+            if m:
+                holidays.add((int(m.group(1) or 0), int(m.group(2)), int(m.group(3))))
+    return frozenset(holidays)
+
+
+class WorkCalendar:
+    """ Office hours of a site, the bitsets are compiled per year on first use.
+    Bit (yday * 24 + hour) of the year is set in the core time and daylight sets.
+    """
+    __slots__ = ('coretime', 'daylight', 'weekend', 'holidays', 'years')
+
+    def __init__(self, coretime=coretime, daylight=daylight, weekend=weekend, holidays=frozenset()):
+        self.coretime = coretime
+        self.daylight = (min(daylight[0], coretime[0]), max(daylight[1], coretime[1]))
+        self.weekend = frozenset(weekend)
+        self.holidays = holidays
+        self.years = {}   # year -> (core bitset, daylight bitset)
+
+    def compile(self, year):
+        days = (datetime.date(year+1, 1, 1) - datetime.date(year, 1, 1)).days
+        core = bytearray((days * 24 + 7) // 8)
+        day = bytearray(len(core))
+        first = datetime.date(year, 1, 1)
+        for yday in range(days):
+            date = first + datetime.timedelta(days=yday)
+            if (date.weekday() in self.weekend or (year, date.month, date.day) in self.holidays
+                    or (0, date.month, date.day) in self.holidays):
+                continue
+            for hour in range(self.daylight[0], self.daylight[1]):
+                i = yday * 24 + hour
+                day[i >> 3] |= 1 << (i & 7)
+                if self.coretime[0] <= hour < self.coretime[1]:
+                    core[i >> 3] |= 1 << (i & 7)
+        self.years[year] = (bytes(core), bytes(day))
+        return self.years[year]
+
+    def phase(self, dt):
+        """ Office phase of the local datetime: 'work', 'day' or 'rest'.
+        """
+        return self.hour_phase(dt.year, dt.timetuple().tm_yday - 1, dt.hour)
+
+    def hour_phase(self, year, yday, hour):
+        """ Office phase of the hour of the day of the year, yday from 0.
+        """
+        bits = self.years.get(year) or self.compile(year)
+        i = yday * 24 + hour
+        mask = 1 << (i & 7)
+        if bits[0][i >> 3] & mask:
+            return 'work'
+        if bits[1][i >> 3] & mask:
+            return 'day'
+        return 'rest'
+
+    def working_day(self, date):
+        return not (date.weekday() in self.weekend or (date.year, date.month, date.day) in self.holidays
+                    or (0, date.month, date.day) in self.holidays)
+
+
+default = WorkCalendar()
+
+
+def parse_hours(text):
+    # 9-17 -> (9, 17)
+    a, b = text.split('-')
+    a, b = int(a), int(b)
+    if not 0 <= a < b <= 24:
+        raise ValueError(f'hours out of range: {text}')
+    return (a, b)
+
+
+def parse_days(text):
+    # Fri,Sat -> (4, 5); '-' for no weekend
+    return tuple(DAYS.index(day[:3].lower()) for day in text.split(',') if day != '-')
+
+
+def read_workdays(fname=WORKDAYS):
+    """ Calendars of the file: dict key -> WorkCalendar, the same lines share the calendar.
+    """
+    calendars = {}
+    shared = {}
+    if not os.path.isfile(fname):
+        return calendars
+    holiday_files = {}
+    with open(fname, 'r') as f:
+        for n, raw in enumerate(f, 1):
+            line = raw.strip()
+            if not line or line[0] == '#':
+                continue
+            items = re.split('\t+', line.replace('"', ''))
+            try:
+                hours = parse_hours(items[1]) if len(items) > 1 else coretime
+                days = parse_days(items[2]) if len(items) > 2 else weekend
+                holidays = frozenset()
+                if len(items) > 3:
+                    if items[3] not in holiday_files:
+                        holiday_files[items[3]] = read_holidays(items[3])
+                    holidays = holiday_files[items[3]]
+            except (ValueError, IndexError, OSError) as e:
+                print(f'{fname}:{n}: {items[0]} ignored, {e}', file=sys.stderr)
+                continue
+            key = (hours, days, holidays)
+            if key not in shared:
+                shared[key] = WorkCalendar(hours, daylight, days, holidays)
+            calendars[items[0]] = shared[key]
+    return calendars
+
+
+def site_calendar(calendars, zone, city, country):
+    """ Calendar of the site, by city, zone or country.
+    """
+    for key in (city.strip(), zone, country):
+        if key in calendars:
+            return calendars[key]
+    return default
+
+
+def common_hours(cals, zones, since, hours):
+    """ Range planning: the UTC hours from since (epoch seconds, rounded down
+    to the hour) when every site is in the core time. List of epoch seconds.
+    """
+    since -= since % 3600
+    found = []
+    for ts in range(since, since + hours * 3600, 3600):
+        for cal, zone in zip(cals, zones):
+            local = tzbundle.EPOCH + datetime.timedelta(seconds=ts + tzbundle.offset_at(zone, ts))
+            if cal.phase(local) != 'work':
+                break
+        else:
+            found.append(ts)
+    return found
+
+
+if __name__ == '__main__':
+    import tzrows
+    tzlist_file = tzrows.TZLIST
+    workdays_file = WORKDAYS
+    days = 7
+
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 workcal.py [-t tzlist_file] [-w workdays_file] [-d days]
+    list the hours of the next days when all sites are in the office core time
+""", file=sys.stderr)
+            quit()
+        elif option == "-t" and i+1 < len(sys.argv):
+            i += 1
+            if os.path.isfile(sys.argv[i]):
+                tzlist_file = sys.argv[i]
+        elif option == "-w" and i+1 < len(sys.argv):
+            i += 1
+            workdays_file = sys.argv[i]
+        elif option == "-d" and i+1 < len(sys.argv):
+            i += 1
+            days = int(sys.argv[i])
+        i += 1
+
+    sites = [site for site in tzbundle.read_tzlist(tzlist_file) if site[0] in pytz.all_timezones_set]
+    if not sites:
+        print(f'no sites from {tzlist_file}', file=sys.stderr)
+        quit()
+    tzbundle.use_bundle([site[0] for site in sites])
+    calendars = read_workdays(workdays_file)
+    cals = [site_calendar(calendars, *site) for site in sites]
+
+    found = common_hours(cals, [site[0] for site in sites], int(time.time()), days * 24)
+    if not found:
+        print(f'no common office hours in the next {days} days', file=sys.stderr)
+    for ts in found:
+        print((tzbundle.EPOCH + datetime.timedelta(seconds=ts)).strftime('%a %Y-%m-%d %H:%M UTC'))
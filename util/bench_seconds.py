@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+#
+#
+# CPU time of the seconds mode of timez2.py (-s) on a large board,
+# the per second tick against the per minute update, both run the methods
+# of TimesWindow on real rows, only the widgets are stubbed out,
+# for example: python3 bench_seconds.py -n 200 -r 60
+#
+
+import os
+import sys
+import time
+import datetime
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import tzbundle
+import tzrows
+import timez2
+
+class Widget:
+    # stub of the labels, list stores and views: the calls are counted only
+    calls = 0
+    def __getattr__(self, name):
+        return self.call
+    def call(self, *args, **kwargs):
+        Widget.calls += 1
+
+class Board:
+    """ The state of a TimesWindow without the window, running its own
+    tick(), update() and redraw_gui() methods.
+    """
+    tick = timez2.TimesWindow.tick
+    update = timez2.TimesWindow.update
+    redraw_gui = timez2.TimesWindow.redraw_gui
+    order_rows = timez2.TimesWindow.order_rows
+
+    def __init__(self, n):
+        # n rows with the zones of pytz, one grid like timez2.py -s
+        zones = [z for z in pytz.common_timezones if '/' in z][:n]
+        zones = (zones * (n // len(zones) + 1))[:n]
+        tzbundle.use_bundle(sorted(set(zones)), '/tmp/bench-bundle.bin')
+        self.grids = 1
+        self.json_file = '/nonexistent/sunrise-sunset.json'
+        self.json_mtime = None
+        self.sunrise_index = {}
+        self.by_offset = False
+        self.stale = False
+        self.skipped = self.tooltip_skipped = 0
+        self.home_index = 0
+        self.local_index = 0
+        self.utc_icon = self.home_icon = None
+        self.vbox = Widget()
+        self.utcnow = datetime.datetime.utcnow()
+        self.offsets = tzrows.OffsetMatrix(zones)
+        self.offsets.update(int((self.utcnow - tzbundle.EPOCH).total_seconds()))
+        self.tzlist = [tzrows.Row(self, zone, zone.split('/')[-1], 'Country', None, None) for zone in zones]
+        for row in self.tzlist:
+            row.gui = timez2.RowGui(Widget(), Widget(), Widget(), Widget(), [Widget() for k in range(9)],
+                                    None, None, None)
+        self.redraw_gui()
+
+if __name__ == '__main__':
+    n = 200
+    rounds = 60
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 bench_seconds.py [-n rows] [-r rounds]
+""", file=sys.stderr)
+            quit()
+        elif option == "-n" and i+1 < len(sys.argv):
+            i += 1
+            n = int(sys.argv[i])
+        elif option == "-r" and i+1 < len(sys.argv):
+            i += 1
+            rounds = int(sys.argv[i])
+        i += 1
+
+    tzrows.seconds = True
+    board = Board(n)
+    utcnow = board.utcnow
+
+    def update(r):
+        # the minute: a new instant, the time columns are recomputed
+        board.utcnow = utcnow + datetime.timedelta(minutes=r)
+        board.update()
+
+    def tick(r):
+        board.tick(utcnow + datetime.timedelta(seconds=r))
+
+    for name, fn in (('update', update), ('tick', tick)):
+        Widget.calls = 0
+        start = time.process_time()
+        for r in range(rounds):
+            fn(r)
+        cpu = (time.process_time() - start) / rounds
+        print(f'{name:6s} {n} rows: {cpu * 1000:.3f} ms CPU per update, {Widget.calls // rounds} widget calls')
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# TimeZ is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# TimeZ is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for details <http://www.gnu.org/licenses/>.
+#
+#
+# Local stub of https://api.sunrise-sunset.org with fault injection,
+# for example: python3 sunrise_stub.py -p 8080 --fail 0.3 --slow 0.1 --reject 0.2
+#              python3 req.py -u http://localhost:8080/json
+#
+
+import sys
+import json
+import time
+import random
+import zlib
+import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+faults = {'fail': 0.0,    # rate of HTTP 500 answers
+          'error': 0.0,   # rate of UNKNOWN_ERROR answers
+          'slow': 0.0,    # rate of answers after 'delay' seconds, the client times out
+          'delay': 15.0,
+          'garbage': 0.0, # rate of answers which are not JSON
+          'reject': 0.0}  # rate of INVALID_REQUEST answers for valid coordinates, for the negative cache
+
+def results(lat, lon):
+    # plausible values, the solar noon shifted by the longitude
+    today = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    noon = today + datetime.timedelta(hours=12 - lon / 15.0)
+    half = datetime.timedelta(hours=6 + 3 * abs(lat) / 90.0)
+    civil = datetime.timedelta(minutes=30)
+    return {'sunrise': (noon - half).isoformat(),
+            'sunset': (noon + half).isoformat(),
+            'solar_noon': noon.isoformat(),
+            'day_length': int(2 * half.total_seconds()),
+            'civil_twilight_begin': (noon - half - civil).isoformat(),
+            'civil_twilight_end': (noon + half + civil).isoformat(),
+            'nautical_twilight_begin': (noon - half - 2 * civil).isoformat(),
+            'nautical_twilight_end': (noon + half + 2 * civil).isoformat(),
+            'astronomical_twilight_begin': (noon - half - 3 * civil).isoformat(),
+            'astronomical_twilight_end': (noon + half + 3 * civil).isoformat()}
+
+class Handler(BaseHTTPRequestHandler):
+
+    def answer(self, code, body):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        r = random.random()
+        if r < faults['fail']:
+            return self.answer(500, 'Internal Server Error')
+        r -= faults['fail']
+        if r < faults['error']:
+            return self.answer(200, {'results': '', 'status': 'UNKNOWN_ERROR'})
+        r -= faults['error']
+        if r < faults['slow']:
+            time.sleep(faults['delay'])
+        r -= faults['slow']
+        if r < faults['garbage']:
+            return self.answer(200, '<html>')
+
+        try:
+            lat = float(query['lat'][0])
+            lon = float(query['lng'][0])
+            assert abs(lat) <= 90 and abs(lon) <= 180
+        except (KeyError, ValueError, AssertionError):
+            return self.answer(400, {'results': '', 'status': 'INVALID_REQUEST'})
+        # the same coordinates are always rejected, like the real API does
+        if zlib.crc32(f'{lat:.4f};{lon:.4f}'.encode()) / 2**32 < faults['reject']:
+            return self.answer(400, {'results': '', 'status': 'INVALID_REQUEST'})
+        return self.answer(200, {'results': results(lat, lon), 'status': 'OK'})
+
+if __name__ == '__main__':
+    port = 8080
+    i = 1
+    while i < len(sys.argv):
+        option = sys.argv[i]
+        if option == "-h":
+            print(f"""
+Usage: python3 sunrise_stub.py [-p port] [--fail rate] [--error rate] [--slow rate] [--delay seconds] [--garbage rate] [--reject rate]
+""", file=sys.stderr)
+            quit()
+        elif option == "-p" and i+1 < len(sys.argv):
+            i += 1
+            port = int(sys.argv[i])
+        elif option[2:] in faults and i+1 < len(sys.argv):
+            i += 1
+            faults[option[2:]] = float(sys.argv[i])
+        i += 1
+
+    print(f'sunrise stub on port {port}, faults {faults}', file=sys.stderr)
+    HTTPServer(('localhost', port), Handler).serve_forever()